@@ -38,13 +38,37 @@
 
 import sqlite3
 import json
+import sys
+from collections import Counter
+from contextlib import closing
+from itertools import islice
+from operator import itemgetter
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 사용
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # ijson 미설치 시 파일 전체를 한 번에 파싱
+    ijson = None
+
 DB_PATH = Path("metabolic_health.sqlite")
 CASES_JSON = Path("health_cases.json")
+BATCH_SIZE = 1000
+
+# 연령대 라벨 (0대 ~ 120대), 나이 // 10 으로 바로 조회
+DECADE_LABELS = tuple(f"{decade}대" for decade in range(0, 130, 10))
 
 SCHEMA_SQL = """
 PRAGMA foreign_keys = ON;
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -20000;
+PRAGMA mmap_size = 268435456;
 
 -- 환자 기본 정보
 CREATE TABLE IF NOT EXISTS patients (
@@ -86,16 +110,42 @@ CREATE TABLE IF NOT EXISTS health_exams (
   FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
 );
 
--- 인덱스: 환자별 검진 이력 조회 최적화
-CREATE INDEX IF NOT EXISTS idx_health_exams_patient 
-ON health_exams(patient_id, exam_at DESC);
+-- 인덱스: 환자별 최신 검진 조회 최적화
+-- (진단에 필요한 측정값을 포함해 테이블 접근 없이 인덱스만으로 조회)
+CREATE INDEX IF NOT EXISTS idx_health_exams_latest
+ON health_exams(
+  patient_id, exam_at DESC,
+  waist_cm, systolic_mmHg, diastolic_mmHg,
+  fbg_mg_dl, tg_mg_dl, hdl_mg_dl, bmi
+);
 """
 
+PATIENT_INSERT_SQL = """
+INSERT INTO patients (name, sex, age, rrn_masked, registered_at)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+EXAM_INSERT_SQL = """
+INSERT INTO health_exams (
+  patient_id, exam_at, facility_name, doc_registered_on,
+  height_cm, weight_kg, waist_cm,
+  systolic_mmHg, diastolic_mmHg, fbg_mg_dl,
+  tg_mg_dl, hdl_mg_dl, tc_mg_dl, ldl_mg_dl, bmi
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# INSERT 컬럼 순서에 맞춘 케이스 필드 추출기 (dict 조회를 C 수준에서 한 번에 수행)
+PATIENT_FIELDS = itemgetter("name", "sex", "age", "rrn", "reg")
+EXAM_FIELDS = itemgetter(
+    "exam_at", "facility", "doc_reg", "height", "weight", "waist",
+    "sys", "dia", "fbg", "tg", "hdl", "tc", "ldl",
+)
+
 
 def calculate_bmi(height_cm, weight_kg):
     """BMI 계산 (키는 cm, 몸무게는 kg)"""
     height_m = height_cm / 100
-    return round(weight_kg / (height_m**2), 2)
+    return round(weight_kg / (height_m * height_m), 2)
 
 
 def load_cases():
@@ -106,8 +156,12 @@ def load_cases():
         )
 
     try:
-        with open(CASES_JSON, "r", encoding="utf-8") as f:
-            cases = json.load(f)
+        if orjson is not None:
+            # UTF-8 바이트를 그대로 파싱해 str 디코딩 단계를 생략
+            cases = orjson.loads(CASES_JSON.read_bytes())
+        else:
+            with open(CASES_JSON, "r", encoding="utf-8") as f:
+                cases = json.load(f)
         print(f"✅ {CASES_JSON}에서 {len(cases)}개의 케이스를 로드했습니다.")
         return cases
     except json.JSONDecodeError as e:
@@ -118,6 +172,66 @@ def load_cases():
         raise
 
 
+def iter_cases():
+    """케이스를 하나씩 반환 (ijson이 있으면 파일을 스트리밍 파싱)"""
+    if ijson is None:
+        yield from load_cases()
+        return
+
+    if not CASES_JSON.exists():
+        raise FileNotFoundError(
+            f"{CASES_JSON} 파일을 찾을 수 없습니다. health_cases.json 파일이 필요합니다."
+        )
+    with open(CASES_JSON, "rb") as f:
+        yield from ijson.items(f, "item", use_float=True)
+
+
+def iter_batches(items, size):
+    """이터러블을 size 개씩 묶어 리스트로 반환"""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def compute_batch_stats(cases, age_groups, sex_count):
+    """한 번의 순회로 BMI 열을 계산하고 연령대/성별 통계를 누적"""
+    bmis = []
+    for case in cases:
+        bmis.append(calculate_bmi(case["height"], case["weight"]))
+        decade = case["age"] // 10
+        if 0 <= decade < len(DECADE_LABELS):
+            age_groups[DECADE_LABELS[decade]] += 1
+        else:
+            age_groups[f"{decade * 10}대"] += 1
+        sex_count[case["sex"]] += 1
+    return bmis
+
+
+def insert_batch(cur, cases, bmis):
+    """케이스 묶음을 환자/검진 테이블에 일괄 삽입"""
+    # 1. 환자 정보 일괄 삽입
+    cur.executemany(PATIENT_INSERT_SQL, map(PATIENT_FIELDS, cases))
+
+    # 새로 생성한 DB이므로 patient_id는 삽입 순서대로 부여된다
+    patient_ids = [
+        row[0]
+        for row in cur.execute(
+            "SELECT patient_id FROM patients ORDER BY patient_id DESC LIMIT ?",
+            (len(cases),),
+        ).fetchall()
+    ]
+    patient_ids.reverse()
+
+    # 2. 검진 정보 + 측정 데이터 일괄 삽입
+    cur.executemany(
+        EXAM_INSERT_SQL,
+        [
+            (patient_id, *EXAM_FIELDS(case), bmi)
+            for patient_id, case, bmi in zip(patient_ids, cases, bmis)
+        ],
+    )
+
+
 def main():
     """메인 실행 함수"""
     # 기존 DB 삭제
@@ -125,79 +239,43 @@ def main():
         DB_PATH.unlink()
         print(f"🗑️  기존 데이터베이스 삭제: {DB_PATH}")
 
-    # DB 연결 및 스키마 생성
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.executescript(SCHEMA_SQL)
-    print(f"✅ 데이터베이스 생성: {DB_PATH}")
+    total = 0
+    age_groups = Counter()
+    sex_count = Counter()
 
-    # JSON 케이스 로드
-    cases = load_cases()
+    # DB 연결 및 스키마 생성 (트랜잭션은 직접 관리, 블록 종료 시 연결 해제)
+    with closing(sqlite3.connect(DB_PATH, isolation_level=None)) as conn:
+        cur = conn.cursor()
+        cur.executescript(SCHEMA_SQL)
+        print(f"✅ 데이터베이스 생성: {DB_PATH}")
 
-    print(f"\n📊 데이터 삽입 중...")
+        print(f"\n📊 데이터 삽입 중...")
 
-    for i, case in enumerate(cases, 1):
-        # BMI 자동 계산
-        calculated_bmi = calculate_bmi(case["height"], case["weight"])
+        # 전체 삽입을 단일 트랜잭션으로 묶어 fsync를 한 번만 수행
+        # (with conn: 성공 시 COMMIT, 예외 시 ROLLBACK)
+        # 케이스는 BATCH_SIZE 단위로 읽어 삽입하므로 전체 목록을 메모리에 두지 않는다
+        cur.execute("BEGIN")
+        with conn:
+            for batch in iter_batches(iter_cases(), BATCH_SIZE):
+                bmis = compute_batch_stats(batch, age_groups, sex_count)
+                insert_batch(cur, batch, bmis)
+                total += len(batch)
+                # 배치 단위로만 진행 상황을 기록하고 강제 flush는 하지 않는다
+                sys.stdout.write(f"  ✓ {total}명 환자/검진 데이터 삽입 완료\n")
 
-        # 1. 환자 정보 삽입
-        cur.execute(
-            """INSERT INTO patients (name, sex, age, rrn_masked, registered_at) 
-               VALUES (?, ?, ?, ?, ?)""",
-            (case["name"], case["sex"], case["age"], case["rrn"], case["reg"]),
-        )
-        patient_id = cur.lastrowid
-
-        # 2. 검진 정보 + 측정 데이터 통합 삽입
-        cur.execute(
-            """INSERT INTO health_exams (
-               patient_id, exam_at, facility_name, doc_registered_on,
-               height_cm, weight_kg, bmi, waist_cm,
-               systolic_mmHg, diastolic_mmHg, fbg_mg_dl,
-               tg_mg_dl, hdl_mg_dl, tc_mg_dl, ldl_mg_dl
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                patient_id,
-                case["exam_at"],
-                case["facility"],
-                case["doc_reg"],
-                case["height"],
-                case["weight"],
-                calculated_bmi,
-                case["waist"],
-                case["sys"],
-                case["dia"],
-                case["fbg"],
-                case["tg"],
-                case["hdl"],
-                case["tc"],
-                case["ldl"],
-            ),
-        )
-
-        if i % 5 == 0:
-            print(f"  ✓ {i}/{len(cases)} 환자 데이터 삽입 완료")
-
-    conn.commit()
-    conn.close()
+        # 조회 플래너가 커버링 인덱스를 고르도록 통계(sqlite_stat1)를 만든 뒤 커서를 바로 해제
+        cur.execute("ANALYZE")
+        cur.close()
 
     print(f"\n✅ 데이터베이스 생성 완료!")
     print(f"\n📈 통계 정보:")
-    print(f"  - 총 환자 수: {len(cases)}명")
+    print(f"  - 총 환자 수: {total}명")
 
     # 연령대별 통계
-    age_groups = {}
-    for case in cases:
-        age_group = f"{case['age']//10*10}대"
-        age_groups[age_group] = age_groups.get(age_group, 0) + 1
-
-    for age_group in sorted(age_groups.keys()):
+    for age_group in sorted(age_groups):
         print(f"  - {age_group}: {age_groups[age_group]}명")
 
     # 성별 통계
-    sex_count = {"남": 0, "여": 0}
-    for case in cases:
-        sex_count[case["sex"]] += 1
     print(f"  - 남성: {sex_count['남']}명, 여성: {sex_count['여']}명")
 
 
@@ -2,30 +2,56 @@
 
 from __future__ import annotations
 
+import re
+from contextvars import ContextVar
 from dataclasses import dataclass
 from datetime import date
-from textwrap import dedent
-from typing import Dict, List, Literal, Optional, TypedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, List, Literal, Optional, TypedDict
 
-from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
-from langgraph.graph import END, START, StateGraph
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import BaseMessage
 
 from meal_plan.services import MealPlanRequest, RevisionInstruction
 
-SYSTEM_PROMPT = dedent(
-    """
-    당신은 대사증후군 상담을 지원하는 식단 전문가이다.
-    환자의 임상 정보를 해석해 한식 중심의 저당·저염·고식이섬유 식단을 설계한다.
-    - 필요한 경우 혈당 관리, 체중 조절, 운동 후 회복을 위해 가공당과 포화지방을 최소화한다.
-    - 각 식사는 구체적인 음식명과 1인분 분량(예: g, 컵, 작은접시 등)을 제시한다.
-    - 재료 선택 시 현지 조리법과 계절 채소를 우선 고려한다.
-    - 요청된 칼로리 목표와 간식 정책을 벗어나지 않도록 한다.
-    - 환자의 기저질환/위험요인을 고려해 나트륨을 제한하고 수분 섭취 지침을 포함한다.
-    출력은 반드시 날짜 × (아침, 점심, 저녁, 간식) 4열을 가진 마크다운 표 형식이어야 한다.
-    표 아래에는 칼로리 요약과 상담 포인트를 항목으로 정리한다.
-    """
-).strip()
+SYSTEM_PROMPT = """\
+당신은 대사증후군 상담을 지원하는 식단 전문가이다.
+환자의 임상 정보를 해석해 한식 중심의 저당·저염·고식이섬유 식단을 설계한다.
+- 필요한 경우 혈당 관리, 체중 조절, 운동 후 회복을 위해 가공당과 포화지방을 최소화한다.
+- 각 식사는 구체적인 음식명과 1인분 분량(예: g, 컵, 작은접시 등)을 제시한다.
+- 재료 선택 시 현지 조리법과 계절 채소를 우선 고려한다.
+- 요청된 칼로리 목표와 간식 정책을 벗어나지 않도록 한다.
+- 환자의 기저질환/위험요인을 고려해 나트륨을 제한하고 수분 섭취 지침을 포함한다.
+출력은 반드시 날짜 × (아침, 점심, 저녁, 간식) 4열을 가진 마크다운 표 형식이어야 한다.
+표 아래에는 칼로리 요약과 상담 포인트를 항목으로 정리한다."""
+
+
+@lru_cache(maxsize=None)
+def _system_message() -> BaseMessage:
+    """고정된 시스템 프롬프트 메시지. 첫 프롬프트를 만들 때 한 번만 생성한다."""
+    # langchain_core.messages는 pydantic까지 불러오므로 모듈 import 시점에는 피한다.
+    from langchain_core.messages import SystemMessage
+
+    return SystemMessage(content=SYSTEM_PROMPT)
+
+
+_OUTPUT_RULES = (
+    "출력 규칙:",
+    "- 날짜는 YYYY-MM-DD 형식으로 표에 기입한다.",
+    "- 표는 날짜 오름차순으로 정렬하고 각 행에 아침/점심/저녁/간식을 채운다.",
+    "- 각 셀에는 음식, 조리법, 분량(예: g, 컵, 큰술)을 명시한다.",
+    "- 표 아래에 총 칼로리와 상담사가 확인할 주의사항을 bullet으로 정리한다.",
+    "- 요청된 시작일과 종료일을 모두 포함해 기간 내 모든 날짜를 빠짐없이 기입한다.",
+)
+
+# 마크다운 표에서 날짜로 시작하는 행 (| 2024-05-01 | ...)
+_DATED_ROW = re.compile(r"^\|\s*\d{4}-\d{2}-\d{2}")
+
+_CONTINUITY_INSTRUCTION = (
+    "이번 기간 식단은 위 내용을 기반으로 날짜가 겹치지 않게 이어서 제안한다. "
+    "음식 구성을 다양화하되 칼로리, 간식 정책 등 기준은 유지한다."
+)
 
 
 class MealPlanState(TypedDict, total=False):
@@ -37,6 +63,7 @@ class MealPlanState(TypedDict, total=False):
     messages: List[BaseMessage]
     llm_markdown: str
     previous_plan: str
+    on_token: Callable[[str], None]
 
 
 @dataclass
@@ -48,46 +75,89 @@ class MealPlanResult:
     mode: Literal["create", "revise"]
     metadata: Dict[str, str]
 
+    def continuity_digest(self, days: int = 2) -> str:
+        """다음 구간 생성 시 참고할 마지막 며칠의 표 행만 추린다."""
+        rows = [line for line in self.markdown.splitlines() if _DATED_ROW.match(line)]
+        return "\n".join(rows[-days:]) if days > 0 else ""
+
 
 class MealPlanAgent:
     """LangGraph 기반 식단 생성/수정 에이전트."""
 
+    # 그래프 구조는 인스턴스와 무관하므로 클래스 단위로 한 번만 컴파일한다.
+    _compiled_graph = None
+
     def __init__(self, chat_model: BaseChatModel):
         self.chat_model = chat_model
-        self.graph = self._build_graph()
 
-    def _build_graph(self):
+    @property
+    def graph(self):
+        return type(self)._get_compiled_graph()
+
+    @classmethod
+    def _get_compiled_graph(cls):
+        if cls._compiled_graph is None:
+            cls._compiled_graph = cls._build_graph()
+        return cls._compiled_graph
+
+    @staticmethod
+    def _build_graph():
+        # LangGraph는 첫 실행 시에만 필요하므로 여기서 불러온다.
+        # StateGraph가 MealPlanState의 타입 힌트를 해석하므로 BaseMessage도 모듈에 올린다.
+        global BaseMessage
+        from langchain_core.messages import BaseMessage
+        from langgraph.graph import END, START, StateGraph
+
         builder = StateGraph(MealPlanState)
-        builder.add_node("build_messages", self._build_messages)
-        builder.add_node("invoke_llm", self._invoke_llm)
+        builder.add_node("build_messages", _build_messages_node)
+        builder.add_node("invoke_llm", _invoke_llm_node)
         builder.add_edge(START, "build_messages")
         builder.add_edge("build_messages", "invoke_llm")
         builder.add_edge("invoke_llm", END)
         return builder.compile()
 
+    def _run_graph(self, payload: Dict[str, object]) -> MealPlanState:
+        token = _CURRENT_AGENT.set(self)
+        try:
+            return self.graph.invoke(payload)
+        finally:
+            _CURRENT_AGENT.reset(token)
+
     def generate_plan(
         self,
         patient_context: str,
         request: MealPlanRequest,
         previous_plan: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> MealPlanResult:
-        payload: Dict[str, object] = {
-            "mode": "create",
-            "patient_context": patient_context.strip(),
-            "request": request,
-        }
-        if previous_plan:
-            payload["previous_plan"] = previous_plan.strip()
+        payload = self._create_payload(patient_context, request, previous_plan)
+        if on_token is not None:
+            payload["on_token"] = on_token
+        state = self._run_graph(payload)
+        return self._created_result(state["llm_markdown"], request)
 
-        state = self.graph.invoke(payload)
-        return MealPlanResult(
-            markdown=state["llm_markdown"],
-            start_date=request.start_date,
-            end_date=request.end_date,
-            patient_id=request.patient_id,
-            mode="create",
-            metadata={"status": "created"},
-        )
+    async def agenerate_plan(
+        self,
+        patient_context: str,
+        request: MealPlanRequest,
+        previous_plan: Optional[str] = None,
+    ) -> MealPlanResult:
+        """generate_plan의 비동기 버전. 여러 기간을 동시에 요청할 때 사용한다."""
+        # 그래프는 메시지 구성 → LLM 호출의 직선 구조이므로 같은 단계를 직접 밟되,
+        # LLM 호출만 ainvoke로 바꿔 이벤트 루프를 막지 않는다.
+        messages = self.build_messages(patient_context, request, previous_plan)
+        response = await self.chat_model.ainvoke(messages)
+        return self._created_result(_response_text(response).strip(), request)
+
+    def build_messages(
+        self,
+        patient_context: str,
+        request: MealPlanRequest,
+        previous_plan: Optional[str] = None,
+    ) -> List[BaseMessage]:
+        """식단 생성 프롬프트 메시지만 구성한다 (배치 요청 등 외부 호출용)."""
+        payload = self._create_payload(patient_context, request, previous_plan)
+        return self._build_messages(payload)["messages"]
 
     def revise_plan(
         self,
@@ -95,16 +165,18 @@ class MealPlanAgent:
         request: MealPlanRequest,
         revision: RevisionInstruction,
         existing_plan: str,
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> MealPlanResult:
-        state = self.graph.invoke(
-            {
-                "mode": "revise",
-                "patient_context": patient_context.strip(),
-                "request": request,
-                "revision": revision,
-                "existing_plan": existing_plan.strip(),
-            }
-        )
+        payload: MealPlanState = {
+            "mode": "revise",
+            "patient_context": patient_context.strip(),
+            "request": request,
+            "revision": revision,
+            "existing_plan": existing_plan.strip(),
+        }
+        if on_token is not None:
+            payload["on_token"] = on_token
+        state = self._run_graph(payload)
         return MealPlanResult(
             markdown=state["llm_markdown"],
             start_date=request.start_date,
@@ -114,65 +186,135 @@ class MealPlanAgent:
             metadata={"status": "revised", "change_notes": revision.change_notes},
         )
 
+    @staticmethod
+    def _create_payload(
+        patient_context: str,
+        request: MealPlanRequest,
+        previous_plan: Optional[str],
+    ) -> MealPlanState:
+        payload: MealPlanState = {
+            "mode": "create",
+            "patient_context": patient_context.strip(),
+            "request": request,
+        }
+        if previous_plan:
+            payload["previous_plan"] = previous_plan.strip()
+        return payload
+
+    @staticmethod
+    def _created_result(markdown: str, request: MealPlanRequest) -> MealPlanResult:
+        return MealPlanResult(
+            markdown=markdown,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            patient_id=request.patient_id,
+            mode="create",
+            metadata={"status": "created"},
+        )
+
     # ------------------------------------------------------------------ #
     # LangGraph nodes
     # ------------------------------------------------------------------ #
 
     def _build_messages(self, state: MealPlanState) -> Dict[str, List[BaseMessage]]:
+        # 빈 줄 없이 한 줄씩 쌓아 마지막에 한 번만 join 한다.
         request = state["request"]
-        user_sections: List[str] = [
-            "환자 컨텍스트:",
-            state.get("patient_context", "").strip() or "환자 정보가 제공되지 않았습니다.",
-            "",
-            "요청 파라미터:",
-            *request.summary_lines(),
-            "",
-            "출력 규칙:",
-            "- 날짜는 YYYY-MM-DD 형식으로 표에 기입한다.",
-            "- 표는 날짜 오름차순으로 정렬하고 각 행에 아침/점심/저녁/간식을 채운다.",
-            "- 각 셀에는 음식, 조리법, 분량(예: g, 컵, 큰술)을 명시한다.",
-            "- 표 아래에 총 칼로리와 상담사가 확인할 주의사항을 bullet으로 정리한다.",
-            "- 요청된 시작일과 종료일을 모두 포함해 기간 내 모든 날짜를 빠짐없이 기입한다.",
-        ]
+        lines: List[str] = ["환자 컨텍스트:"]
+        lines.append(
+            state.get("patient_context", "").strip() or "환자 정보가 제공되지 않았습니다."
+        )
+        lines.append("요청 파라미터:")
+        lines.extend(request.summary_lines())
+        lines.extend(_OUTPUT_RULES)
 
         previous_plan = state.get("previous_plan")
         if previous_plan:
-            user_sections.extend(
-                [
-                    "",
-                    "이전 기간 식단(연속성 참고용):",
-                    previous_plan,
-                    "",
-                    "이번 기간 식단은 위 내용을 기반으로 날짜가 겹치지 않게 이어서 제안한다. "
-                    "음식 구성을 다양화하되 칼로리, 간식 정책 등 기준은 유지한다.",
-                ]
-            )
+            lines.append("이전 기간 식단(연속성 참고용):")
+            lines.append(previous_plan)
+            lines.append(_CONTINUITY_INSTRUCTION)
 
         if state.get("mode") == "revise":
             revision = state["revision"]
             existing_plan = state.get("existing_plan", "")
-            user_sections.extend(
-                [
-                    "",
-                    "기존 식단 요약:",
-                    existing_plan,
-                    "",
-                    "수정 지시:",
-                    revision.describe(),
-                    "지시된 날짜/식사 외에는 기존 내용을 유지한다.",
-                ]
-            )
-
-        system = SystemMessage(content=SYSTEM_PROMPT)
-        human = HumanMessage(content="\n".join(filter(None, user_sections)))
-        return {"messages": [system, human]}
+            lines.append("기존 식단 요약:")
+            if existing_plan:
+                lines.append(existing_plan)
+            lines.append("수정 지시:")
+            lines.append(revision.describe())
+            lines.append("지시된 날짜/식사 외에는 기존 내용을 유지한다.")
+
+        from langchain_core.messages import HumanMessage
+
+        human = HumanMessage(content="\n".join(lines))
+        return {"messages": [_system_message(), human]}
 
     def _invoke_llm(self, state: MealPlanState) -> Dict[str, str]:
-        response = self.chat_model.invoke(state["messages"])
-        content = getattr(response, "content", response)
-        if not isinstance(content, str):
-            content = str(content)
-        return {"llm_markdown": content.strip()}
+        on_token = state.get("on_token")
+        if on_token is None:
+            response = self.chat_model.invoke(state["messages"])
+            return {"llm_markdown": _response_text(response).strip()}
+
+        # stream()은 모델 캐시를 거치지 않으므로 invoke()와 같은 키로 먼저 조회한다.
+        cache = self._llm_cache()
+        if cache is not None:
+            from langchain_core.load import dumps
+
+            prompt = dumps(state["messages"])
+            llm_string = self.chat_model._get_llm_string()
+            cached = cache.lookup(prompt, llm_string)
+            if cached:
+                text = _response_text(cached[0].message)
+                on_token(text)
+                return {"llm_markdown": text.strip()}
+
+        # 토큰이 도착하는 대로 콜백에 넘겨 첫 출력까지의 대기 시간을 줄인다.
+        parts: List[str] = []
+        for chunk in self.chat_model.stream(state["messages"]):
+            token = _response_text(chunk)
+            if token:
+                on_token(token)
+                parts.append(token)
+        raw = "".join(parts)
+        if cache is not None:
+            from langchain_core.messages import AIMessage
+            from langchain_core.outputs import ChatGeneration
+
+            cache.update(prompt, llm_string, [ChatGeneration(message=AIMessage(content=raw))])
+        return {"llm_markdown": raw.strip()}
+
+    def _llm_cache(self):
+        """모델에 적용되는 LLM 캐시를 LangChain과 같은 규칙으로 찾는다."""
+        setting = getattr(self.chat_model, "cache", False)
+        if setting is False:
+            return None
+        from langchain_core.caches import BaseCache
+        from langchain_core.globals import get_llm_cache
+
+        if isinstance(setting, BaseCache):
+            return setting
+        return get_llm_cache()
+
+
+def _response_text(response: object) -> str:
+    content = getattr(response, "content", response)
+    if not isinstance(content, str):
+        content = str(content)
+    return content
+
+
+# ---------------------------------------------------------------------- #
+# 공유 그래프 노드: 실행 중인 에이전트에 위임한다.
+# ---------------------------------------------------------------------- #
+
+_CURRENT_AGENT: ContextVar[MealPlanAgent] = ContextVar("meal_plan_agent")
+
+
+def _build_messages_node(state: MealPlanState) -> Dict[str, List[BaseMessage]]:
+    return _CURRENT_AGENT.get()._build_messages(state)
+
+
+def _invoke_llm_node(state: MealPlanState) -> Dict[str, str]:
+    return _CURRENT_AGENT.get()._invoke_llm(state)
 
 
 __all__ = ["MealPlanAgent", "MealPlanResult"]
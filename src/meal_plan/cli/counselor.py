@@ -2,12 +2,26 @@
 
 from __future__ import annotations
 
+import asyncio
+import heapq
 import json
+import os
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass, replace
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Optional
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
 from dotenv import load_dotenv
 from os import getenv
@@ -42,14 +56,47 @@ def _resolve_chunk_days(default: int = 14) -> int:
     return max(1, value)
 
 
+def _resolve_max_concurrency(default: int = 8) -> int:
+    raw = getenv("MEAL_PLAN_MAX_CONCURRENCY")
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError as exc:
+        raise ValueError("MEAL_PLAN_MAX_CONCURRENCY must be an integer.") from exc
+    return max(1, value)
+
+
 DEFAULT_CHAT_MODEL = getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 DEFAULT_CHAT_TEMPERATURE = _resolve_temperature()
 MAX_CHUNK_DAYS = _resolve_chunk_days()
+MAX_CONCURRENCY = _resolve_max_concurrency()
+PLAN_CACHE_SIZE = 32
+HISTORY_LOG_NAME = "history.ndjson"
+# LangChain 메시지 타입 → Chat Completions API role
+_BATCH_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+ROSTER_CACHE_ENABLED = getenv("MEAL_PLAN_ROSTER_CACHE", "on").strip().lower() not in {
+    "",
+    "0",
+    "off",
+    "false",
+}
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+    from meal_plan.agents import MealPlanAgent, MealPlanResult
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 사용
+    orjson = None
+
+try:
+    from prompt_toolkit import PromptSession
+except ImportError:  # prompt_toolkit 미설치 시 내장 input() 사용
+    PromptSession = None
 
-from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_openai import ChatOpenAI
-
-from meal_plan.agents import MealPlanAgent, MealPlanResult
 from meal_plan.context import PatientContextProvider
 from meal_plan.data import PatientDatabase
 from meal_plan.services import (
@@ -60,9 +107,75 @@ from meal_plan.services import (
 )
 
 
+def _write_plan_files(
+    markdown_path: Path, markdown: str, log_path: Path, log_payload: Dict[str, object]
+):
+    markdown_path.parent.mkdir(parents=True, exist_ok=True)
+    # 이력 로그를 처음 만들 때는 이전 방식으로 저장된 식단부터 옮겨 적는다.
+    lines = [] if log_path.exists() else _legacy_history_lines(markdown_path.parent)
+    markdown_path.write_text(markdown, encoding="utf-8")
+    lines.append(_dump_json_line(log_payload))
+    # 환자별 로그 파일 하나에 한 줄씩 덧붙인다 (버퍼 없이 write 한 번).
+    with open(log_path, "ab", buffering=0) as log_file:
+        log_file.write(b"".join(lines))
+
+
+def _legacy_history_lines(folder: Path) -> List[bytes]:
+    """history.ndjson 도입 전 저장된 식단을 저장 순서대로 로그 줄로 만든다."""
+    lines = []
+    for markdown_path in sorted(folder.glob("mealplan_*.md")):
+        # 이전 버전은 식단마다 같은 이름의 .json 로그를 남겼다.
+        payload: Dict[str, object] = {}
+        legacy_log = markdown_path.with_suffix(".json")
+        if legacy_log.exists():
+            try:
+                payload = _load_json(legacy_log.read_bytes())
+            except ValueError:
+                pass
+        payload["markdown"] = markdown_path.name
+        lines.append(_dump_json_line(payload))
+    return lines
+
+
+def _dump_json_line(payload: Dict[str, object]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload) + b"\n"
+    return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _load_json(raw: bytes) -> Dict[str, object]:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _tail_lines(path: Path, count: int, block_size: int = 4096) -> List[bytes]:
+    """파일 끝에서부터 블록 단위로 읽어 마지막 count개 줄만 반환한다."""
+    with open(path, "rb") as handle:
+        end = handle.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= count:
+            step = min(block_size, end)
+            end -= step
+            handle.seek(end)
+            data = handle.read(step) + data
+    return [line for line in data.splitlines() if line.strip()][-count:]
+
+
+def _report_write_failure(future: Future):
+    exc = future.exception()
+    if exc is not None:  # pragma: no cover
+        print(f"\n식단 파일 저장 중 오류가 발생했습니다: {exc}")
+
+
+def _write_token(token: str):
+    """스트리밍 토큰을 줄바꿈 없이 바로 출력한다."""
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
 @dataclass
 class SessionState:
     patient_id: Optional[int] = None
+    patient_context: Optional[str] = None  # LLM 전달용 간결한 요약 (prompt 포맷)
     request: Optional[MealPlanRequest] = None
     latest_plan: Optional["MealPlanResult"] = None  # forward reference
     latest_path: Optional[Path] = None
@@ -77,12 +190,30 @@ class MealPlanCLI:
         model: Optional[BaseChatModel] = None,
         output_root: Path = Path("meal_plans"),
     ):
+        self._owns_db = db is None
         self.db = db or PatientDatabase()
         self.context_provider = PatientContextProvider(self.db)
         self.normalizer = RequestNormalizer()
         self.output_root = output_root
         self.state = SessionState()
         self.counselor_profile = CounselorProfile.MEDICAL
+        self._plan_cache: Dict[Tuple[str, Tuple[Hashable, ...]], MealPlanResult] = {}
+        self._roster_cache: Optional[Tuple[Tuple[int, ...], List[tuple]]] = None
+        self._http_client = None
+        self._async_http_client = None
+        self._openai_client = None
+        # 저장 작업은 제출 순서대로 실행되어야 이력 로그 순서가 뒤섞이지 않는다.
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mealplan-io")
+        self._pending_writes: List[Future] = []
+        # 비동기 클라이언트가 닫힌 루프에 묶이지 않도록 CLI 수명 동안 하나의 루프를 재사용한다.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 터미널에서 실행될 때만 prompt_toolkit 세션을 사용한다 (파이프 입력은 input()).
+        self._prompt_session = (
+            PromptSession() if PromptSession is not None and sys.stdin.isatty() else None
+        )
+        # 에이전트 모듈은 LangChain 메시지 타입을 쓰므로 CLI를 만들 때 불러온다.
+        from meal_plan.agents import MealPlanAgent
+
         self.agent = MealPlanAgent(model or self._bootstrap_model())
 
     def _bootstrap_model(self) -> BaseChatModel:
@@ -90,9 +221,51 @@ class MealPlanCLI:
             raise RuntimeError(
                 "OPENAI_API_KEY is not set. Store it in your environment or a .env file."
             )
+        # langchain_openai는 무거우므로 실제 모델이 필요할 때만 불러온다.
+        from langchain_openai import ChatOpenAI
+
         model_name = DEFAULT_CHAT_MODEL
         temperature = DEFAULT_CHAT_TEMPERATURE
-        return ChatOpenAI(model=model_name, temperature=temperature)
+        return ChatOpenAI(
+            model=model_name,
+            temperature=temperature,
+            cache=self._build_llm_cache(),
+            http_client=self._shared_http_client(),
+            http_async_client=self._shared_async_http_client(),
+        )
+
+    def _shared_http_client(self):
+        """모든 동기 OpenAI 호출이 keep-alive 연결을 재사용하도록 공유하는 HTTP 클라이언트."""
+        if self._http_client is None:
+            import httpx
+
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                timeout=60.0,
+            )
+        return self._http_client
+
+    def _shared_async_http_client(self):
+        """동시 구간 생성(ainvoke)용 비동기 HTTP 클라이언트. self._loop에서만 사용한다."""
+        if self._async_http_client is None:
+            import httpx
+
+            self._async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                timeout=60.0,
+            )
+        return self._async_http_client
+
+    def _build_llm_cache(self):
+        """동일 프롬프트 재요청 시 API 호출 없이 응답을 재사용하는 디스크 캐시."""
+        raw = getenv("MEAL_PLAN_LLM_CACHE")
+        if raw is not None and raw.strip().lower() in {"", "0", "off", "false"}:
+            return None
+        from langchain_community.cache import SQLiteCache
+
+        cache_path = Path(raw) if raw else self.output_root / ".llm_cache.db"
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        return SQLiteCache(database_path=str(cache_path))
 
     # ------------------------------------------------------------------ #
     # CLI flow
@@ -100,6 +273,7 @@ class MealPlanCLI:
 
     def run(self):
         self._print_banner()
+        self._poll_batches()
 
         while True:
             patient_id = self._prompt_patient()
@@ -107,32 +281,46 @@ class MealPlanCLI:
                 print("프로그램을 종료합니다.")
                 return
 
-            self.state = SessionState(patient_id=patient_id)
-            patient_context = self.context_provider.get_patient_context(
+            display_context = self.context_provider.get_patient_context(
                 patient_id, format="standard"
             )
-            if not patient_context:
+            if not display_context:
                 print("환자 정보를 불러올 수 없습니다. 다른 환자를 선택해주세요.")
                 continue
 
-            print("\n=== 환자 위험 요약 ===")
-            print(patient_context)
-
-            self._interaction_loop(patient_id, patient_context)
+            # 화면에는 상세 요약을 보여주고, LLM에는 토큰이 적은 요약을 전달한다.
+            patient_context = (
+                self.context_provider.get_patient_context(patient_id, format="prompt")
+                or display_context
+            )
+            self.state = SessionState(
+                patient_id=patient_id, patient_context=patient_context
+            )
 
-    def _interaction_loop(self, patient_id: int, patient_context: str):
+            print("\n=== 환자 위험 요약 ===")
+            print(display_context)
+
+            self._interaction_loop()
+
+    def _interaction_loop(self):
+        # 환자 세션마다 한 번만 명령 → 핸들러 표를 만든다.
+        commands: Dict[str, Callable[[], None]] = {
+            "plan": self._handle_plan,
+            "plan-batch": self._handle_plan_batch,
+            "modify": self._handle_modify,
+            "show": self._handle_show,
+            "history": self._handle_history,
+        }
         while True:
-            print("\n명령을 입력하세요: [plan | modify | show | history | back | exit]")
-            command = input("> ").strip().lower()
-
-            if command == "plan":
-                self._handle_plan(patient_id, patient_context)
-            elif command == "modify":
-                self._handle_modify(patient_id, patient_context)
-            elif command == "show":
-                self._handle_show()
-            elif command == "history":
-                self._handle_history(patient_id)
+            print(
+                "\n명령을 입력하세요: "
+                "[plan | plan-batch | modify | show | history | back | exit]"
+            )
+            command = self._ask("> ").strip().lower()
+
+            handler = commands.get(command)
+            if handler is not None:
+                handler()
             elif command == "back":
                 break
             elif command == "exit":
@@ -145,65 +333,128 @@ class MealPlanCLI:
     # Command handlers
     # ------------------------------------------------------------------ #
 
-    def _handle_plan(self, patient_id: int, patient_context: str):
+    def _session_patient(self) -> Tuple[int, str]:
+        """현재 세션의 환자 ID와 LLM 전달용 요약 (run()에서 SessionState에 저장)."""
+        state = self.state
+        return state.patient_id, state.patient_context or ""  # type: ignore[return-value]
+
+    def _handle_plan(self):
+        patient_id, patient_context = self._session_patient()
         try:
             request = self._collect_plan_request(patient_id)
-            plan = self._generate_sequence(patient_context, request)
+            print("\n=== 생성된 식단 ===")
+            plan = self._generate_cached(
+                patient_context, request, on_token=_write_token
+            )
             filepath = self._persist_plan(plan, request)
             self.state.request = request
             self.state.latest_plan = plan
             self.state.latest_path = filepath
 
-            print("\n=== 생성된 식단 ===")
-            print(plan.markdown)
-            print(f"\n저장 완료: {filepath}")
+            print(f"\n\n저장 예약됨: {filepath}")
         except ValueError as exc:
             print(f"요청이 올바르지 않습니다: {exc}")
         except Exception as exc:  # pragma: no cover
             print(f"식단 생성 중 오류가 발생했습니다: {exc}")
 
+    def _generate_cached(
+        self,
+        patient_context: str,
+        request: MealPlanRequest,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> MealPlanResult:
+        """정규화한 요청이 같으면 이전에 생성한 식단을 재사용한다."""
+        key = (" ".join(patient_context.split()), request.cache_key())
+        cached = self._plan_cache.get(key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached.markdown)
+            return replace(cached, patient_id=request.patient_id)
+
+        plan = self._generate_sequence(patient_context, request, on_token=on_token)
+        if len(self._plan_cache) >= PLAN_CACHE_SIZE:
+            del self._plan_cache[next(iter(self._plan_cache))]
+        self._plan_cache[key] = plan
+        return plan
+
     def _generate_sequence(
-        self, patient_context: str, request: MealPlanRequest
+        self,
+        patient_context: str,
+        request: MealPlanRequest,
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> MealPlanResult:
+        chunk_requests = self._split_request(request)
+        if len(chunk_requests) == 1:
+            return self.agent.generate_plan(
+                patient_context, request, on_token=on_token
+            )
+
+        # 구간들을 두 차례로 나눠 동시에 요청한다 (순서는 유지).
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        chunk_results = self._loop.run_until_complete(
+            self._generate_chunks(patient_context, chunk_requests)
+        )
+        plan = self._combine_chunks(
+            request, chunk_requests, [result.markdown for result in chunk_results]
+        )
+        # 구간들은 동시에 생성되므로 결합된 결과를 한 번에 전달한다.
+        if on_token is not None:
+            on_token(plan.markdown)
+        return plan
+
+    @staticmethod
+    def _split_request(request: MealPlanRequest) -> List[MealPlanRequest]:
+        """요청 기간을 MAX_CHUNK_DAYS 단위 구간으로 나눈다."""
         max_days = max(1, MAX_CHUNK_DAYS)
         if request.duration_days <= max_days:
-            return self.agent.generate_plan(patient_context, request)
-
-        segments: List[tuple[MealPlanRequest, MealPlanResult]] = []
-        previous_markdown: Optional[str] = None
-        current_start = request.start_date
-        while current_start <= request.end_date:
-            current_end = min(
-                current_start + timedelta(days=max_days - 1), request.end_date
-            )
-            chunk_request = replace(
-                request, start_date=current_start, end_date=current_end
-            )
-            chunk_result = self.agent.generate_plan(
-                patient_context,
-                chunk_request,
-                previous_plan=previous_markdown,
+            return [request]
+
+        # 구간 수를 미리 계산해 목록을 한 번에 할당한다.
+        chunk_count = -(-request.duration_days // max_days)
+        chunk_requests: List[MealPlanRequest] = [None] * chunk_count  # type: ignore[list-item]
+        span = timedelta(days=max_days)
+        for index in range(chunk_count):
+            current_start = request.start_date + span * index
+            current_end = min(current_start + span - timedelta(days=1), request.end_date)
+            chunk_requests[index] = request.with_dates(current_start, current_end)
+        return chunk_requests
+
+    @staticmethod
+    def _combine_chunks(
+        request: MealPlanRequest,
+        chunk_requests: List[MealPlanRequest],
+        markdowns: List[str],
+    ) -> MealPlanResult:
+        """구간별 마크다운을 기간 제목과 함께 하나의 결과로 합친다."""
+        from meal_plan.agents import MealPlanResult
+
+        if len(chunk_requests) == 1:
+            return MealPlanResult(
+                markdown=markdowns[0],
+                start_date=request.start_date,
+                end_date=request.end_date,
+                patient_id=request.patient_id,
+                mode="create",
+                metadata={"status": "created"},
             )
-            segments.append((chunk_request, chunk_result))
-            previous_markdown = chunk_result.markdown
-            current_start = current_end + timedelta(days=1)
-
-        combined_sections = [
-            "\n".join(
-                [
-                    f"### {chunk_request.start_date.isoformat()} ~ {chunk_request.end_date.isoformat()}",
-                    "",
-                    chunk_result.markdown,
-                ]
+
+        # 구간별 문자열을 따로 만들지 않고 한 목록에 모아 한 번만 join 한다.
+        parts: List[str] = []
+        for chunk_request, markdown in zip(chunk_requests, markdowns):
+            if parts:
+                parts.append("")
+            parts.append(
+                f"### {chunk_request.start_date.isoformat()} ~ {chunk_request.end_date.isoformat()}"
             )
-            for chunk_request, chunk_result in segments
-        ]
-        combined_markdown = "\n\n".join(combined_sections)
+            parts.append("")
+            parts.append(markdown)
+        combined_markdown = "\n".join(parts)
 
         metadata = {
             "status": "created",
-            "chunks": str(len(segments)),
-            "chunk_span_days": str(max_days),
+            "chunks": str(len(chunk_requests)),
+            "chunk_span_days": str(max(1, MAX_CHUNK_DAYS)),
         }
         return MealPlanResult(
             markdown=combined_markdown,
@@ -214,26 +465,210 @@ class MealPlanCLI:
             metadata=metadata,
         )
 
-    def _handle_modify(self, patient_id: int, patient_context: str):
+    async def _generate_chunks(
+        self, patient_context: str, chunk_requests: List[MealPlanRequest]
+    ) -> List[MealPlanResult]:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        results: List[Optional[MealPlanResult]] = [None] * len(chunk_requests)
+
+        async def _generate(index: int, previous_plan: Optional[str] = None):
+            # API 호출 한도를 넘지 않도록 동시 요청 수를 제한한다.
+            async with semaphore:
+                results[index] = await self.agent.agenerate_plan(
+                    patient_context, chunk_requests[index], previous_plan=previous_plan
+                )
+
+        def _longest_first(indices: range) -> List[int]:
+            # 긴 구간부터 세마포어를 잡게 해 짧은 구간이 마지막에 홀로 남지 않도록 한다.
+            return sorted(
+                indices, key=lambda index: chunk_requests[index].duration_days, reverse=True
+            )
+
+        # 1차: 짝수 번째 구간은 서로 독립적으로 생성한다.
+        await asyncio.gather(
+            *(_generate(index) for index in _longest_first(range(0, len(results), 2)))
+        )
+        # 2차: 홀수 번째 구간은 직전 구간의 마지막 며칠만 참고해 이어서 생성한다.
+        await asyncio.gather(
+            *(
+                _generate(index, results[index - 1].continuity_digest())
+                for index in _longest_first(range(1, len(results), 2))
+            )
+        )
+        return results  # type: ignore[return-value]
+
+    def _handle_plan_batch(self):
+        """OpenAI Batch API로 식단 생성을 예약한다 (24시간 내 완료, 비용 절감)."""
+        patient_id, patient_context = self._session_patient()
+        try:
+            request = self._collect_plan_request(patient_id)
+            chunk_requests = self._split_request(request)
+            lines = []
+            for index, chunk_request in enumerate(chunk_requests):
+                messages = self.agent.build_messages(patient_context, chunk_request)
+                body = {
+                    "model": DEFAULT_CHAT_MODEL,
+                    "temperature": DEFAULT_CHAT_TEMPERATURE,
+                    "messages": [
+                        {"role": _BATCH_ROLES[message.type], "content": message.content}
+                        for message in messages
+                    ],
+                }
+                lines.append(
+                    json.dumps(
+                        {
+                            "custom_id": f"chunk-{index}",
+                            "method": "POST",
+                            "url": "/v1/chat/completions",
+                            "body": body,
+                        },
+                        ensure_ascii=False,
+                    )
+                )
+
+            client = self._batch_client()
+            input_file = client.files.create(
+                file=("mealplan_batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch",
+            )
+            batch = client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+
+            folder = self.output_root / str(patient_id)
+            folder.mkdir(parents=True, exist_ok=True)
+            pending = {
+                "batch_id": batch.id,
+                "request": self._request_payload(request),
+                "chunks": [
+                    [chunk.start_date.isoformat(), chunk.end_date.isoformat()]
+                    for chunk in chunk_requests
+                ],
+            }
+            (folder / f"batch_{batch.id}.json").write_text(
+                json.dumps(pending, ensure_ascii=False), encoding="utf-8"
+            )
+            print(f"\n배치 요청을 등록했습니다: {batch.id} ({len(chunk_requests)}개 구간)")
+            print("완료된 결과는 다음 실행 또는 history 명령에서 저장됩니다.")
+        except ValueError as exc:
+            print(f"요청이 올바르지 않습니다: {exc}")
+        except Exception as exc:  # pragma: no cover
+            print(f"배치 요청 중 오류가 발생했습니다: {exc}")
+
+    def _poll_batches(self, patient_id: Optional[int] = None):
+        """대기 중인 배치 요청을 확인하고 완료된 결과를 식단 파일로 저장한다."""
+        folder = "*" if patient_id is None else str(patient_id)
+        pattern = f"{folder}/batch_*.json"
+        pending_files = sorted(self.output_root.glob(pattern))
+        if not pending_files:
+            return
+
+        try:
+            client = self._batch_client()
+        except Exception as exc:  # pragma: no cover
+            print(f"배치 상태를 확인할 수 없습니다: {exc}")
+            return
+
+        for pending_path in pending_files:
+            try:
+                pending = json.loads(pending_path.read_text(encoding="utf-8"))
+                batch = client.batches.retrieve(pending["batch_id"])
+                if batch.status in {"failed", "expired", "cancelled"}:
+                    print(f"배치 {batch.id} 처리 실패 ({batch.status}), 요청을 삭제합니다.")
+                    pending_path.unlink()
+                    continue
+                if batch.status != "completed":
+                    print(f"배치 {batch.id} 진행 중 ({batch.status})")
+                    continue
+
+                # 모든 요청이 실패하면 completed 상태여도 output_file_id가 없다.
+                outputs: Dict[str, str] = {}
+                for record in self._batch_records(client, batch.output_file_id):
+                    response = record.get("response") or {}
+                    choices = (response.get("body") or {}).get("choices") or []
+                    if choices:
+                        content = choices[0]["message"]["content"] or ""
+                        outputs[record["custom_id"]] = content.strip()
+
+                request = self._request_from_payload(pending["request"])
+                chunk_requests = [
+                    request.with_dates(date.fromisoformat(start), date.fromisoformat(end))
+                    for start, end in pending["chunks"]
+                ]
+                custom_ids = [f"chunk-{index}" for index in range(len(chunk_requests))]
+                missing = [custom_id for custom_id in custom_ids if custom_id not in outputs]
+                if missing:
+                    # 일부 구간이 빠진 식단은 저장하지 않고, 재시도해도 같으므로 요청을 정리한다.
+                    errors = self._batch_errors(client, batch.error_file_id)
+                    print(
+                        f"배치 {batch.id} 완료, {len(missing)}개 구간 생성 실패로 "
+                        "저장하지 않고 요청을 삭제합니다."
+                    )
+                    for custom_id in missing:
+                        print(f"  - {custom_id}: {errors.get(custom_id, '결과 없음')}")
+                    pending_path.unlink()
+                    continue
+
+                markdowns = [outputs[custom_id] for custom_id in custom_ids]
+                plan = self._combine_chunks(request, chunk_requests, markdowns)
+                plan.metadata["batch_id"] = batch.id
+                filepath = self._persist_plan(plan, request)
+                pending_path.unlink()
+                print(f"배치 {batch.id} 완료, 저장 예약됨: {filepath}")
+            except Exception as exc:  # pragma: no cover
+                print(f"배치 결과 처리 중 오류가 발생했습니다 ({pending_path.name}): {exc}")
+
+    @staticmethod
+    def _batch_records(client, file_id: Optional[str]) -> Iterator[Dict[str, object]]:
+        """배치 결과/오류 파일의 JSONL 레코드를 차례로 반환한다 (파일이 없으면 비어 있음)."""
+        if not file_id:
+            return
+        for line in client.files.content(file_id).text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+    @classmethod
+    def _batch_errors(cls, client, file_id: Optional[str]) -> Dict[str, str]:
+        """오류 파일에서 요청(custom_id)별 오류 메시지를 모은다."""
+        errors: Dict[str, str] = {}
+        for record in cls._batch_records(client, file_id):
+            error = record.get("error") or {}
+            if not error:
+                body = (record.get("response") or {}).get("body") or {}
+                error = body.get("error") or {}
+            errors[record["custom_id"]] = error.get("message") or "알 수 없는 오류"
+        return errors
+
+    def _batch_client(self):
+        if self._openai_client is None:
+            from openai import OpenAI
+
+            self._openai_client = OpenAI(http_client=self._shared_http_client())
+        return self._openai_client
+
+    def _handle_modify(self):
+        _, patient_context = self._session_patient()
         if not self.state.latest_plan or not self.state.request:
             print("먼저 plan 명령으로 식단을 생성한 뒤 수정할 수 있습니다.")
             return
 
         try:
             revision = self._collect_revision()
+            print("\n=== 수정된 식단 ===")
             plan = self.agent.revise_plan(
                 patient_context,
                 self.state.request,
                 revision,
                 self.state.latest_plan.markdown,  # type: ignore[union-attr]
+                on_token=_write_token,
             )
             filepath = self._persist_plan(plan, self.state.request, revision)
             self.state.latest_plan = plan
             self.state.latest_path = filepath
 
-            print("\n=== 수정된 식단 ===")
-            print(plan.markdown)
-            print(f"\n저장 완료: {filepath}")
+            print(f"\n\n저장 예약됨: {filepath}")
         except ValueError as exc:
             print(f"수정 요청이 올바르지 않습니다: {exc}")
         except Exception as exc:  # pragma: no cover
@@ -248,32 +683,63 @@ class MealPlanCLI:
         if self.state.latest_path:
             print(f"\n저장 위치: {self.state.latest_path}")
 
-    def _handle_history(self, patient_id: int):
+    def _handle_history(self):
+        patient_id, _ = self._session_patient()
+        self._poll_batches(patient_id)
+        self._flush_writes()
         folder = self.output_root / str(patient_id)
-        if not folder.exists():
-            print("저장된 식단이 없습니다.")
-            return
-        files = sorted(folder.glob("mealplan_*.md"))
-        if not files:
+        log_path = folder / HISTORY_LOG_NAME
+        if log_path.exists():
+            latest = [
+                _load_json(line)["markdown"] for line in _tail_lines(log_path, 10)
+            ]
+        else:
+            # 이력 로그가 없던 이전 저장 폴더는 파일명으로 목록을 만든다.
+            latest = self._scan_plan_names(folder)
+        if not latest:
             print("저장된 식단이 없습니다.")
             return
         print("\n=== 저장 이력 ===")
-        for path in files[-10:]:
-            print(path.name)
+        for name in latest:
+            print(name)
+
+    @staticmethod
+    def _scan_plan_names(folder: Path, limit: int = 10) -> List[str]:
+        try:
+            with os.scandir(folder) as entries:
+                # 파일명에 저장 시각이 들어 있으므로 stat 없이 이름만으로 최근 항목을 고른다.
+                latest = heapq.nlargest(
+                    limit,
+                    (
+                        entry.name
+                        for entry in entries
+                        if entry.name.startswith("mealplan_")
+                        and entry.name.endswith(".md")
+                    ),
+                )
+        except FileNotFoundError:
+            return []
+        latest.reverse()
+        return latest
 
     # ------------------------------------------------------------------ #
     # Input helpers
     # ------------------------------------------------------------------ #
 
+    def _ask(self, message: str) -> str:
+        if self._prompt_session is None:
+            return input(message)
+        return self._prompt_session.prompt(message)
+
     def _collect_plan_request(self, patient_id: int) -> MealPlanRequest:
         print("\n=== 식단 요청 입력 ===")
-        start_date = input("시작일 (YYYY-MM-DD): ").strip()
-        end_date = input("종료일 (YYYY-MM-DD): ").strip()
-        calories = input("일일 칼로리 목표 (예: 1800kcal, 미입력 가능): ").strip()
-        preferred = input("선호 식품 (쉼표 구분, 미입력 가능): ").split(",")
-        avoided = input("기피 식품 (쉼표 구분, 미입력 가능): ").split(",")
-        snack_policy = input("간식 정책 (포함/제외, 기본=포함): ").strip()
-        notes = input("특이 요청 (선택): ")
+        start_date = self._ask("시작일 (YYYY-MM-DD): ").strip()
+        end_date = self._ask("종료일 (YYYY-MM-DD): ").strip()
+        calories = self._ask("일일 칼로리 목표 (예: 1800kcal, 미입력 가능): ").strip()
+        preferred = self._ask("선호 식품 (쉼표 구분, 미입력 가능): ").split(",")
+        avoided = self._ask("기피 식품 (쉼표 구분, 미입력 가능): ").split(",")
+        snack_policy = self._ask("간식 정책 (포함/제외, 기본=포함): ").strip()
+        notes = self._ask("특이 요청 (선택): ")
 
         return self.normalizer.normalize_plan_request(
             counselor_profile=self.counselor_profile,
@@ -289,9 +755,9 @@ class MealPlanCLI:
 
     def _collect_revision(self) -> RevisionInstruction:
         print("\n=== 수정 요청 입력 ===")
-        dates = input("수정할 날짜 (쉼표로 구분, YYYY-MM-DD): ").split(",")
-        meals = input("식사 구분 (예: 아침,저녁 / 비우면 전체): ").split(",")
-        notes = input("수정 지시 사항: ")
+        dates = self._ask("수정할 날짜 (쉼표로 구분, YYYY-MM-DD): ").split(",")
+        meals = self._ask("식사 구분 (예: 아침,저녁 / 비우면 전체): ").split(",")
+        notes = self._ask("수정 지시 사항: ")
         return self.normalizer.normalize_revision(dates, meals, notes)
 
     # ------------------------------------------------------------------ #
@@ -304,36 +770,86 @@ class MealPlanCLI:
         request: MealPlanRequest,
         revision: Optional[RevisionInstruction] = None,
     ) -> Path:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         folder = self.output_root / str(plan.patient_id)
-        folder.mkdir(parents=True, exist_ok=True)
-
         markdown_path = folder / f"mealplan_{timestamp}.md"
-        markdown_path.write_text(plan.markdown, encoding="utf-8")
 
         log_payload = {
             "mode": plan.mode,
-            "request": {
-                "counselor_profile": request.counselor_profile.value,
-                "patient_id": request.patient_id,
-                "start_date": request.start_date.isoformat(),
-                "end_date": request.end_date.isoformat(),
-                "target_calories": request.target_calories,
-                "preferred_foods": request.preferred_foods,
-                "avoided_foods": request.avoided_foods,
-                "snack_policy": request.snack_policy,
-                "special_notes": request.special_notes,
-            },
+            "request": self._request_payload(request),
             "revision": revision.describe() if revision else None,
             "saved_at": timestamp,
-            "metadata": plan.metadata,
+            "markdown": markdown_path.name,
+            "metadata": dict(plan.metadata),
         }
-        (folder / f"mealplan_{timestamp}.json").write_text(
-            json.dumps(log_payload, ensure_ascii=False, indent=2),
-            encoding="utf-8",
+        # 파일 쓰기는 백그라운드 스레드에서 수행하고 경로만 먼저 반환한다.
+        future = self._io_pool.submit(
+            _write_plan_files,
+            markdown_path,
+            plan.markdown,
+            folder / HISTORY_LOG_NAME,
+            log_payload,
         )
+        # 실패는 history/close까지 미루지 않고 작업이 끝나는 즉시 알린다.
+        future.add_done_callback(_report_write_failure)
+        # 끝난 작업은 추가할 때마다 걸러내 세션 동안 Future가 쌓이지 않게 한다.
+        self._pending_writes = [
+            pending for pending in self._pending_writes if not pending.done()
+        ]
+        self._pending_writes.append(future)
         return markdown_path
 
+    def _flush_writes(self):
+        """대기 중인 파일 저장 작업이 끝날 때까지 기다린다 (오류는 콜백에서 이미 출력됨)."""
+        pending, self._pending_writes = self._pending_writes, []
+        wait(pending)
+
+    def close(self):
+        self._flush_writes()
+        self._io_pool.shutdown(wait=True)
+        if self._loop is not None:
+            # 비동기 클라이언트의 연결은 이 루프에 묶여 있으므로 루프를 닫기 전에 정리한다.
+            if self._async_http_client is not None:
+                self._loop.run_until_complete(self._async_http_client.aclose())
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+            self._loop = None
+        # 루프가 없었다면 비동기 클라이언트는 연결을 연 적이 없다.
+        self._async_http_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        if self._owns_db:
+            self.db.close()
+
+    @staticmethod
+    def _request_payload(request: MealPlanRequest) -> Dict[str, object]:
+        return {
+            "counselor_profile": request.counselor_profile.value,
+            "patient_id": request.patient_id,
+            "start_date": request.start_date.isoformat(),
+            "end_date": request.end_date.isoformat(),
+            "target_calories": request.target_calories,
+            "preferred_foods": request.preferred_foods,
+            "avoided_foods": request.avoided_foods,
+            "snack_policy": request.snack_policy,
+            "special_notes": request.special_notes,
+        }
+
+    @staticmethod
+    def _request_from_payload(payload: Dict[str, object]) -> MealPlanRequest:
+        return MealPlanRequest(
+            counselor_profile=CounselorProfile(payload["counselor_profile"]),
+            patient_id=int(payload["patient_id"]),
+            start_date=date.fromisoformat(payload["start_date"]),
+            end_date=date.fromisoformat(payload["end_date"]),
+            target_calories=payload["target_calories"],
+            preferred_foods=list(payload["preferred_foods"]),
+            avoided_foods=list(payload["avoided_foods"]),
+            snack_policy=payload["snack_policy"],
+            special_notes=payload["special_notes"],
+        )
+
     # ------------------------------------------------------------------ #
     # Selection helpers
     # ------------------------------------------------------------------ #
@@ -346,42 +862,17 @@ class MealPlanCLI:
 
     def _prompt_patient(self) -> Optional[int]:
         print("\n=== 환자 목록 ===")
-        entries = []
-        for patient in self.db.get_all_patients():
-            diagnosis = self.db.check_metabolic_syndrome(patient["patient_id"])
-            if not diagnosis:
-                continue
-            exam_raw = diagnosis.get("exam_at")
-
-            def _parse_exam(value: str) -> datetime:
-                try:
-                    return datetime.fromisoformat(value)
-                except ValueError:
-                    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
-                        try:
-                            return datetime.strptime(value, fmt)
-                        except ValueError:
-                            continue
-                    return datetime.min
-
-            parsed_exam = _parse_exam(exam_raw) if exam_raw else datetime.min
-            entries.append((patient, diagnosis, parsed_exam, exam_raw))
-
-        entries.sort(key=lambda item: item[2], reverse=True)
-
-        for display_idx, (patient, diagnosis, parsed_exam, exam_raw) in enumerate(
-            entries, start=1
-        ):
+        for display_idx, (diagnosis, exam_at) in enumerate(self._load_roster(), start=1):
             status = "🔴 진단" if diagnosis["has_metabolic_syndrome"] else "🟢 정상"
-            exam_label = parsed_exam.date().isoformat() if exam_raw else "정보 없음"
+            exam_label = exam_at.date().isoformat() if diagnosis["exam_at"] else "정보 없음"
             print(
-                f"{display_idx:2d}. {patient['name']} "
-                f"({patient['sex']}, {patient['age']}세, ID {patient['patient_id']}) "
+                f"{display_idx:2d}. {diagnosis['name']} "
+                f"({diagnosis['sex']}, {diagnosis['age']}세, ID {diagnosis['patient_id']}) "
                 f"- {status} | 최근 검진일: {exam_label}"
             )
 
         while True:
-            raw = input("\n환자 ID 입력 (종료: exit): ").strip().lower()
+            raw = self._ask("\n환자 ID 입력 (종료: exit): ").strip().lower()
             if raw in {"exit", "quit"}:
                 return None
             try:
@@ -393,10 +884,49 @@ class MealPlanCLI:
                 return patient_id
             print("해당 환자를 찾을 수 없습니다.")
 
+    def _load_roster(self) -> List[tuple]:
+        """최근 검진일 순으로 정렬한 환자 목록. DB 파일이 바뀌지 않았으면 재사용한다."""
+        token = self._roster_token() if ROSTER_CACHE_ENABLED else None
+        if token is not None and self._roster_cache is not None:
+            cached_token, cached_entries = self._roster_cache
+            if cached_token == token:
+                return cached_entries
+
+        entries = []
+        # 환자별 진단을 한 번의 조회로 가져온다 (검진 기록이 없는 환자는 제외됨).
+        for diagnosis in self.db.get_all_diagnoses():
+            # exam_at은 DB 계층에서 이미 datetime으로 변환되어 있다.
+            entries.append((diagnosis, diagnosis["exam_at"] or datetime.min))
+
+        entries.sort(key=itemgetter(1), reverse=True)
+        if token is not None:
+            # 조회 중 WAL 파일이 새로 생길 수 있으므로 조회 후 토큰을 저장한다.
+            self._roster_cache = (self._roster_token(), entries)
+        return entries
+
+    def _roster_token(self) -> Optional[Tuple[int, ...]]:
+        """DB 파일(및 WAL 파일)의 수정 시각으로 만든 캐시 유효성 토큰."""
+        db_path = getattr(self.db, "db_path", None)
+        if db_path is None:
+            return None
+        db_path = Path(db_path)
+        token: List[int] = []
+        for path in (db_path, db_path.with_name(db_path.name + "-wal")):
+            try:
+                stat = path.stat()
+            except OSError:
+                token.extend((0, 0))
+                continue
+            token.extend((stat.st_mtime_ns, stat.st_size))
+        return tuple(token)
+
 
 def main():
     cli = MealPlanCLI()
-    cli.run()
+    try:
+        cli.run()
+    finally:
+        cli.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
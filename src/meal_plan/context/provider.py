@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 from meal_plan.data import PatientDatabase
 
@@ -10,33 +10,61 @@ from meal_plan.data import PatientDatabase
 class PatientContextProvider:
     """환자 정보를 다양한 포맷으로 제공한다."""
 
+    # 위험 요인별 측정값 표기 템플릿 (standard 포맷)
+    _TEMPLATES: Dict[str, str] = {
+        "abdominal_obesity": "⚠️ {label} (허리둘레 {waist_cm:.1f}cm)",
+        "high_blood_pressure": "⚠️ {label} ({systolic_mmHg}/{diastolic_mmHg}mmHg)",
+        "high_fasting_glucose": "⚠️ {label} (공복혈당 {fbg_mg_dl:.1f}mg/dL)",
+        "high_triglycerides": "⚠️ {label} (중성지방 {tg_mg_dl:.1f}mg/dL)",
+        "low_hdl": "⚠️ {label} (HDL {hdl_mg_dl:.1f}mg/dL)",
+    }
+
+    # LLM 프롬프트용 간결한 표기 (prompt 포맷, 수치는 정수로 반올림)
+    _PROMPT_TEMPLATES: Dict[str, str] = {
+        "abdominal_obesity": "{label}(허리 {waist_cm:.0f}cm)",
+        "high_blood_pressure": "{label}({systolic_mmHg:.0f}/{diastolic_mmHg:.0f}mmHg)",
+        "high_fasting_glucose": "{label}(공복혈당 {fbg_mg_dl:.0f})",
+        "high_triglycerides": "{label}(TG {tg_mg_dl:.0f})",
+        "low_hdl": "{label}(HDL {hdl_mg_dl:.0f})",
+    }
+
+    _RISK_LABELS: Dict[str, str] = {
+        "abdominal_obesity": "복부비만",
+        "high_blood_pressure": "고혈압",
+        "high_fasting_glucose": "공복혈당장애",
+        "high_triglycerides": "고중성지방",
+        "low_hdl": "저HDL콜레스테롤",
+    }
+
     def __init__(self, db: PatientDatabase):
         self.db = db
+        self._cache: Dict[Tuple[int, str], str] = {}
 
     def get_patient_context(self, patient_id: int, format: str = "standard") -> Optional[str]:
-        if format == "standard":
-            return self._format_standard(patient_id)
-        if format == "detailed":
-            return self._format_detailed(patient_id)
-        if format == "compact":
-            return self._format_compact(patient_id)
-        return self._format_standard(patient_id)
+        key = (patient_id, format)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        context = self._format(patient_id, format)
+        if context is not None:
+            self._cache[key] = context
+        return context
+
+    def invalidate(self, patient_id: Optional[int] = None):
+        """캐시된 컨텍스트와 DB의 진단 메모를 함께 비운다. patient_id가 없으면 전체를 비운다."""
+        self.db.invalidate(patient_id)
+        if patient_id is None:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache if key[0] == patient_id]:
+            del self._cache[key]
 
     def list_patients(self, format: str = "compact") -> List[str]:
-        results: List[str] = []
-        for patient in self.db.get_all_patients():
-            context = self.get_patient_context(patient["patient_id"], format=format)
-            if context:
-                results.append(context)
-        return results
+        return self._format_all(self.db.get_all_diagnoses(), format)
 
     def get_metabolic_syndrome_patients(self, format: str = "compact") -> List[str]:
-        results: List[str] = []
-        for diagnosis in self.db.get_patients_with_metabolic_syndrome():
-            context = self.get_patient_context(diagnosis["patient_id"], format=format)
-            if context:
-                results.append(context)
-        return results
+        return self._format_all(self.db.get_patients_with_metabolic_syndrome(), format)
 
     def format_for_llm_context(self, patient_id: Optional[int]) -> str:
         if patient_id is None:
@@ -54,11 +82,36 @@ class PatientContextProvider:
     # 내부 포맷터
     # ------------------------------------------------------------------ #
 
-    def _format_standard(self, patient_id: int) -> Optional[str]:
+    def _format(self, patient_id: int, format: str) -> Optional[str]:
+        if format == "detailed":
+            return self._format_detailed(patient_id)
         diagnosis = self.db.check_metabolic_syndrome(patient_id)
         if not diagnosis:
             return None
-        risk_eval = self.db.evaluate_risk_level(patient_id)
+        return self._select_formatter(format)(diagnosis)
+
+    def _format_all(self, diagnoses: List[Dict], format: str) -> List[str]:
+        """이미 조회된 진단 결과로 포맷팅해 환자별 재조회를 피한다."""
+        if not diagnoses:
+            return []
+        render = self._select_formatter(format)
+        return [context for context in map(render, diagnoses) if context]
+
+    def _select_formatter(self, format: str) -> Callable[[Dict], Optional[str]]:
+        if format == "detailed":
+            return self._render_detailed
+        if format == "compact":
+            return self._render_compact
+        if format == "prompt":
+            return self._render_prompt
+        return self._render_standard
+
+    def _format_detailed(self, patient_id: int) -> Optional[str]:
+        return self.db.generate_diagnostic_report(patient_id)
+
+    def _render_standard(self, diagnosis: Dict) -> str:
+        patient_id = diagnosis["patient_id"]
+        risk_eval = self.db.evaluate_risk_level(patient_id, diagnosis)
         lines = [
             f"[환자 정보 - ID: {patient_id}]",
             f"이름: {diagnosis['name']} ({diagnosis['sex']}, {diagnosis['age']}세)",
@@ -67,44 +120,24 @@ class PatientContextProvider:
             f"위험도: {risk_eval['risk_label'] if risk_eval else '미평가'}",
             "",
         ]
-        risk_labels = {
-            "abdominal_obesity": "복부비만",
-            "high_blood_pressure": "고혈압",
-            "high_fasting_glucose": "공복혈당장애",
-            "high_triglycerides": "고중성지방",
-            "low_hdl": "저HDL콜레스테롤",
-        }
         measurements = diagnosis["measurements"]
         has_risk = False
-        for key, label in risk_labels.items():
+        for key, label in self._RISK_LABELS.items():
             if diagnosis["risk_factors"][key]:
                 if not has_risk:
                     lines.append("위험 요인:")
                     has_risk = True
-                if key == "abdominal_obesity":
-                    lines.append(f"⚠️ {label} (허리둘레 {measurements['waist_cm']:.1f}cm)")
-                elif key == "high_blood_pressure":
-                    lines.append(
-                        f"⚠️ {label} ({measurements['systolic_mmHg']}/{measurements['diastolic_mmHg']}mmHg)"
-                    )
-                elif key == "high_fasting_glucose":
-                    lines.append(f"⚠️ {label} (공복혈당 {measurements['fbg_mg_dl']:.1f}mg/dL)")
-                elif key == "high_triglycerides":
-                    lines.append(f"⚠️ {label} (중성지방 {measurements['tg_mg_dl']:.1f}mg/dL)")
-                elif key == "low_hdl":
-                    lines.append(f"⚠️ {label} (HDL {measurements['hdl_mg_dl']:.1f}mg/dL)")
+                lines.append(self._TEMPLATES[key].format(label=label, **measurements))
         if not has_risk:
             lines.append("위험 요인: 없음 ✅")
         return "\n".join(lines)
 
-    def _format_detailed(self, patient_id: int) -> Optional[str]:
-        return self.db.generate_diagnostic_report(patient_id)
+    def _render_detailed(self, diagnosis: Dict) -> Optional[str]:
+        return self._format_detailed(diagnosis["patient_id"])
 
-    def _format_compact(self, patient_id: int) -> Optional[str]:
-        diagnosis = self.db.check_metabolic_syndrome(patient_id)
-        if not diagnosis:
-            return None
-        risk_eval = self.db.evaluate_risk_level(patient_id)
+    def _render_compact(self, diagnosis: Dict) -> str:
+        patient_id = diagnosis["patient_id"]
+        risk_eval = self.db.evaluate_risk_level(patient_id, diagnosis)
         return (
             f"환자 {patient_id}번 ({diagnosis['name']}, {diagnosis['sex']}, {diagnosis['age']}세): "
             f"대사증후군 {'진단' if diagnosis['has_metabolic_syndrome'] else '없음'}, "
@@ -112,6 +145,25 @@ class PatientContextProvider:
             f"위험요인 {diagnosis['criteria_met']}개"
         )
 
+    def _render_prompt(self, diagnosis: Dict) -> str:
+        """이름/ID 없이 식단 설계에 필요한 항목만 담은 bullet 요약."""
+        risk_eval = self.db.evaluate_risk_level(diagnosis["patient_id"], diagnosis)
+        measurements = diagnosis["measurements"]
+        risks = [
+            self._PROMPT_TEMPLATES[key].format(label=label, **measurements)
+            for key, label in self._RISK_LABELS.items()
+            if diagnosis["risk_factors"][key]
+        ]
+        return "\n".join(
+            [
+                f"- {diagnosis['sex']}, {diagnosis['age']}세",
+                f"- 대사증후군 {'있음' if diagnosis['has_metabolic_syndrome'] else '없음'} "
+                f"({diagnosis['criteria_met']}/5)",
+                f"- 위험도: {risk_eval['risk_label'] if risk_eval else '미평가'}",
+                f"- 위험 요인: {', '.join(risks) if risks else '없음'}",
+            ]
+        )
+
 
 class PatientSession:
     """선택된 환자 정보를 유지하는 세션 컨테이너."""
@@ -139,6 +191,8 @@ class PatientSession:
         return self.current_patient_id is not None
 
     def clear_selection(self):
+        if self.current_patient_id is not None:
+            self.provider.invalidate(self.current_patient_id)
         self.current_patient_id = None
 
 
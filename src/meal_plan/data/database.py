@@ -3,88 +3,327 @@
 from __future__ import annotations
 
 import sqlite3
+import threading
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 대사증후군 진단 기준 (한국인 기준)
+_WAIST_MALE = 90
+_WAIST_FEMALE = 85
+_SYSTOLIC = 130
+_DIASTOLIC = 85
+_FASTING_GLUCOSE = 100
+_TRIGLYCERIDES = 150
+_HDL_MALE = 40
+_HDL_FEMALE = 50
+
+# _evaluate_criteria 결과 튜플의 순서와 같다.
+_RISK_FACTOR_KEYS = (
+    "abdominal_obesity",
+    "high_blood_pressure",
+    "high_fasting_glucose",
+    "high_triglycerides",
+    "low_hdl",
+)
+
+# _SQL_METABOLIC_SYNDROME 계열 쿼리에 바인딩하는 기준값
+_CRITERIA_PARAMS = {
+    "waist_male": _WAIST_MALE,
+    "waist_female": _WAIST_FEMALE,
+    "systolic": _SYSTOLIC,
+    "diastolic": _DIASTOLIC,
+    "fasting_glucose": _FASTING_GLUCOSE,
+    "triglycerides": _TRIGLYCERIDES,
+    "hdl_male": _HDL_MALE,
+    "hdl_female": _HDL_FEMALE,
+}
+
+# 자주 실행되는 조회문은 동일한 SQL 문자열을 재사용해 연결별 statement 캐시에 적중시킨다.
+_SQL_GET_PATIENT = """
+SELECT patient_id, name, sex, age, rrn_masked, registered_at
+FROM patients
+WHERE patient_id = ?
+"""
+
+_SQL_ALL_PATIENTS = """
+SELECT patient_id, name, sex, age, rrn_masked, registered_at
+FROM patients
+ORDER BY patient_id
+"""
+
+_SQL_LATEST_EXAM = """
+SELECT *
+FROM health_exams
+WHERE patient_id = ?
+ORDER BY exam_at DESC
+LIMIT 1
+"""
+
+# 진단에 필요한 환자 정보와 최신 검진 측정값을 한 번에 가져온다.
+_SQL_PATIENT_LATEST_EXAM = """
+SELECT p.patient_id, p.name, p.sex, p.age,
+       e.exam_at, e.waist_cm, e.systolic_mmHg, e.diastolic_mmHg,
+       e.fbg_mg_dl, e.tg_mg_dl, e.hdl_mg_dl, e.bmi
+FROM patients p
+JOIN health_exams e ON e.patient_id = p.patient_id
+WHERE p.patient_id = ?
+ORDER BY e.exam_at DESC
+LIMIT 1
+"""
+
+_SQL_EXAM_HISTORY = """
+SELECT *
+FROM health_exams
+WHERE patient_id = ?
+ORDER BY exam_at DESC
+"""
+
+# 환자별 최신 검진 한 건 (연결마다 TEMP 뷰로 만들어 DB 파일은 건드리지 않는다)
+_SQL_LATEST_EXAM_VIEW = """
+CREATE TEMP VIEW IF NOT EXISTS latest_exams AS
+SELECT patient_id, exam_at, waist_cm, systolic_mmHg,
+       diastolic_mmHg, fbg_mg_dl, tg_mg_dl, hdl_mg_dl, bmi
+FROM (
+    SELECT patient_id, exam_at, waist_cm, systolic_mmHg,
+           diastolic_mmHg, fbg_mg_dl, tg_mg_dl, hdl_mg_dl, bmi,
+           ROW_NUMBER() OVER (
+               PARTITION BY patient_id ORDER BY exam_at DESC
+           ) AS exam_rank
+    FROM health_exams
+)
+WHERE exam_rank = 1
+"""
+
+_SQL_ALL_DIAGNOSES = """
+SELECT p.patient_id, p.name, p.sex, p.age,
+       e.exam_at, e.waist_cm, e.systolic_mmHg, e.diastolic_mmHg,
+       e.fbg_mg_dl, e.tg_mg_dl, e.hdl_mg_dl, e.bmi
+FROM patients p
+JOIN latest_exams e ON e.patient_id = p.patient_id
+ORDER BY p.patient_id
+"""
+
+# 최신 검진 기준 5개 항목 충족 수를 SQL에서 계산해 대사증후군 환자만 반환한다.
+# 측정값이 NULL이면 해당 항목은 미충족으로 본다 (_check_* 헬퍼와 동일).
+_SQL_METABOLIC_SYNDROME = """
+SELECT patient_id, name, sex, age, exam_at, waist_cm, systolic_mmHg,
+       diastolic_mmHg, fbg_mg_dl, tg_mg_dl, hdl_mg_dl, bmi
+FROM (
+    SELECT p.patient_id, p.name, p.sex, p.age,
+           e.exam_at, e.waist_cm, e.systolic_mmHg, e.diastolic_mmHg,
+           e.fbg_mg_dl, e.tg_mg_dl, e.hdl_mg_dl, e.bmi,
+           IFNULL(e.waist_cm >= CASE p.sex WHEN '남' THEN :waist_male
+                                           ELSE :waist_female END, 0)
+           + (e.systolic_mmHg IS NOT NULL AND e.diastolic_mmHg IS NOT NULL
+              AND (e.systolic_mmHg >= :systolic OR e.diastolic_mmHg >= :diastolic))
+           + IFNULL(e.fbg_mg_dl >= :fasting_glucose, 0)
+           + IFNULL(e.tg_mg_dl >= :triglycerides, 0)
+           + IFNULL(e.hdl_mg_dl < CASE p.sex WHEN '남' THEN :hdl_male
+                                             ELSE :hdl_female END, 0)
+           AS criteria_met
+    FROM patients p
+    JOIN latest_exams e ON e.patient_id = p.patient_id
+)
+WHERE criteria_met >= 3
+ORDER BY patient_id
+"""
+
+_SQL_METABOLIC_SYNDROME_COUNT = f"SELECT COUNT(*) FROM ({_SQL_METABOLIC_SYNDROME})"
+
+_SQL_SEX_COUNTS = """
+SELECT COUNT(*),
+       IFNULL(SUM(sex = '남'), 0),
+       IFNULL(SUM(sex = '여'), 0)
+FROM patients
+"""
+
+# 연령대는 처음 등장한 환자 순서대로 정렬해 기존 dict 순서를 유지한다.
+_SQL_AGE_DISTRIBUTION = """
+SELECT age / 10 * 10 AS decade, COUNT(*)
+FROM patients
+GROUP BY decade
+ORDER BY MIN(patient_id)
+"""
+
+# 연결을 처음 열 때 한 번만 적용하는 연결 단위 설정 (빌드 스크립트와 동일한 값).
+# journal_mode는 DB 파일 자체를 바꾸므로 빌드 스크립트에서만 지정한다.
+_CONNECTION_PRAGMAS = """
+PRAGMA synchronous = NORMAL;
+PRAGMA temp_store = MEMORY;
+PRAGMA mmap_size = 268435456;
+PRAGMA cache_size = -20000;
+"""
+
+# 연결별 prepared statement 캐시 크기 (기본 128)
+_CACHED_STATEMENTS = 256
+
+# fromisoformat이 처리하지 못한 검진 일시 문자열에 대해 순서대로 시도한다.
+_TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    """검진 일시 문자열을 datetime으로 변환한다 (같은 문자열은 한 번만 파싱)."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in _TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+# ---- 진단 보고서 고정 문구 ---- #
+
+_REPORT_RULE = "=" * 60
+_SECTION_RULE = "-" * 60
+
+_REPORT_RISK_LABELS = (
+    ("abdominal_obesity", "1. 복부비만"),
+    ("high_blood_pressure", "2. 고혈압"),
+    ("high_fasting_glucose", "3. 공복혈당장애"),
+    ("high_triglycerides", "4. 고중성지방혈증"),
+    ("low_hdl", "5. 저HDL콜레스테롤혈증"),
+)
+
+_MS_ADVICE = (
+    "• 대사증후군으로 진단되어 의료진과의 정기적인 상담이 필요합니다.",
+    "• 생활습관 개선: 규칙적인 운동(주 5회, 30분 이상), 균형잡힌 식단",
+    "• 체중 감량: 현재 체중의 5-10% 감량 목표",
+    "• 금연 및 절주",
+    "• 스트레스 관리 및 충분한 수면",
+)
+_PRE_MS_ADVICE = (
+    "• 대사증후군 전단계로 예방적 관리가 중요합니다.",
+    "• 위험 요인 개선을 위한 생활습관 교정이 필요합니다.",
+)
+_ONE_FACTOR_ADVICE = (
+    "• 1개의 위험 요인이 있어 예방적 관리가 필요합니다.",
+    "• 현재 상태가 악화되지 않도록 건강한 생활습관을 유지하세요.",
+)
+_HEALTHY_ADVICE = (
+    "• 현재 대사증후군 위험이 없으나 정기적인 검진을 권장합니다.",
+    "• 건강한 생활습관을 꾸준히 유지하세요.",
+)
+
+
+def _evaluate_criteria(exam, sex: str) -> Tuple[bool, bool, bool, bool, bool]:
+    """검진 값으로 5개 기준 충족 여부를 한 번에 판정한다 (측정값이 없으면 미충족)."""
+    male = sex == "남"
+    waist = exam["waist_cm"]
+    systolic = exam["systolic_mmHg"]
+    diastolic = exam["diastolic_mmHg"]
+    fbg = exam["fbg_mg_dl"]
+    tg = exam["tg_mg_dl"]
+    hdl = exam["hdl_mg_dl"]
+    return (
+        waist is not None and waist >= (_WAIST_MALE if male else _WAIST_FEMALE),
+        systolic is not None
+        and diastolic is not None
+        and (systolic >= _SYSTOLIC or diastolic >= _DIASTOLIC),
+        fbg is not None and fbg >= _FASTING_GLUCOSE,
+        tg is not None and tg >= _TRIGLYCERIDES,
+        hdl is not None and hdl < (_HDL_MALE if male else _HDL_FEMALE),
+    )
+
+
+def _copy_diagnosis(diagnosis: Dict) -> Dict:
+    """중첩 dict까지 복사해 호출부의 변경이 진단 메모에 남지 않게 한다."""
+    return {
+        **diagnosis,
+        "risk_factors": dict(diagnosis["risk_factors"]),
+        "measurements": dict(diagnosis["measurements"]),
+    }
 
 
 class PatientDatabase:
     """데이터베이스 조회 및 대사증후군 평가를 담당한다."""
 
     CRITERIA = {
-        "waist": {"male": 90, "female": 85},
-        "blood_pressure": {"systolic": 130, "diastolic": 85},
-        "fasting_glucose": 100,
-        "triglycerides": 150,
-        "hdl": {"male": 40, "female": 50},
+        "waist": {"male": _WAIST_MALE, "female": _WAIST_FEMALE},
+        "blood_pressure": {"systolic": _SYSTOLIC, "diastolic": _DIASTOLIC},
+        "fasting_glucose": _FASTING_GLUCOSE,
+        "triglycerides": _TRIGLYCERIDES,
+        "hdl": {"male": _HDL_MALE, "female": _HDL_FEMALE},
     }
 
-    def __init__(self, db_path: str | Path = "metabolic_health.sqlite"):
+    def __init__(
+        self, db_path: str | Path = "metabolic_health.sqlite", read_only: bool = False
+    ):
         self.db_path = Path(db_path)
+        self.read_only = read_only
         if not self.db_path.exists():
             raise FileNotFoundError(
                 f"데이터베이스 파일을 찾을 수 없습니다: {self.db_path}\n"
                 "build_health_scenarios_v2.py를 먼저 실행하세요."
             )
+        # 스레드별로 연결을 하나씩 열어 재사용하고, close()에서 모두 닫는다.
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # 환자별 진단 결과 메모 (데이터가 바뀌면 invalidate()로 비운다)
+        self._diagnoses: Dict[int, Dict] = {}
 
     # ------------------------------------------------------------------ #
     # 기본 조회
     # ------------------------------------------------------------------ #
 
     def _get_connection(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 조회 전용이므로 autocommit 모드로 열고, 다른 스레드에서도 close()할 수 있게 한다.
+            # 모듈 상수 SQL은 연결별 statement 캐시에 남아 재파싱 없이 재사용된다.
+            # read_only이면 SQLite URI의 mode=ro로 열어 파일에 쓰지 않도록 한다.
+            target = (
+                self.db_path.resolve().as_uri() + "?mode=ro"
+                if self.read_only
+                else self.db_path
+            )
+            conn = sqlite3.connect(
+                target,
+                uri=self.read_only,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=_CACHED_STATEMENTS,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.executescript(_CONNECTION_PRAGMAS)
+            conn.execute(_SQL_LATEST_EXAM_VIEW)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
         return conn
 
+    def close(self):
+        """열려 있는 모든 스레드의 연결을 닫는다."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
     def get_patient(self, patient_id: int) -> Optional[Dict]:
-        with self._get_connection() as conn:
-            row = conn.execute(
-                """
-                SELECT patient_id, name, sex, age, rrn_masked, registered_at
-                FROM patients
-                WHERE patient_id = ?
-                """,
-                (patient_id,),
-            ).fetchone()
+        row = self._get_connection().execute(_SQL_GET_PATIENT, (patient_id,)).fetchone()
         return dict(row) if row else None
 
+    def iter_patients(self) -> Iterator[sqlite3.Row]:
+        """전체 환자를 한 행씩 반환한다 (목록 전체를 메모리에 올리지 않는다)."""
+        yield from self._get_connection().execute(_SQL_ALL_PATIENTS)
+
     def get_all_patients(self) -> List[Dict]:
-        with self._get_connection() as conn:
-            rows = conn.execute(
-                """
-                SELECT patient_id, name, sex, age, rrn_masked, registered_at
-                FROM patients
-                ORDER BY patient_id
-                """
-            ).fetchall()
-        return [dict(row) for row in rows]
+        return [dict(row) for row in self.iter_patients()]
 
     def get_latest_exam(self, patient_id: int) -> Optional[Dict]:
-        with self._get_connection() as conn:
-            row = conn.execute(
-                """
-                SELECT *
-                FROM health_exams
-                WHERE patient_id = ?
-                ORDER BY exam_at DESC
-                LIMIT 1
-                """,
-                (patient_id,),
-            ).fetchone()
+        row = self._get_connection().execute(_SQL_LATEST_EXAM, (patient_id,)).fetchone()
         return dict(row) if row else None
 
     def get_exam_history(self, patient_id: int) -> List[Dict]:
-        with self._get_connection() as conn:
-            rows = conn.execute(
-                """
-                SELECT *
-                FROM health_exams
-                WHERE patient_id = ?
-                ORDER BY exam_at DESC
-                """,
-                (patient_id,),
-            ).fetchall()
+        rows = self._get_connection().execute(_SQL_EXAM_HISTORY, (patient_id,)).fetchall()
         return [dict(row) for row in rows]
 
     # ------------------------------------------------------------------ #
@@ -92,74 +331,59 @@ class PatientDatabase:
     # ------------------------------------------------------------------ #
 
     def check_metabolic_syndrome(self, patient_id: int) -> Optional[Dict]:
-        patient = self.get_patient(patient_id)
-        if not patient:
-            return None
-
-        exam = self.get_latest_exam(patient_id)
-        if not exam:
+        diagnosis = self._memoized_diagnosis(patient_id)
+        return _copy_diagnosis(diagnosis) if diagnosis else None
+
+    def _memoized_diagnosis(self, patient_id: int) -> Optional[Dict]:
+        """메모된 진단 결과를 복사 없이 돌려준다 (내부 읽기 전용)."""
+        diagnosis = self._diagnoses.get(patient_id)
+        if diagnosis is not None:
+            return diagnosis
+        row = self._get_patient_with_latest_exam(patient_id)
+        if not row:
             return None
+        diagnosis = self._diagnoses[patient_id] = self._build_diagnosis(row, row)
+        return diagnosis
 
-        sex = patient["sex"]
-        risk_factors = {
-            "abdominal_obesity": self._check_abdominal_obesity(exam["waist_cm"], sex),
-            "high_blood_pressure": self._check_blood_pressure(
-                exam["systolic_mmHg"], exam["diastolic_mmHg"]
-            ),
-            "high_fasting_glucose": self._check_fasting_glucose(exam["fbg_mg_dl"]),
-            "high_triglycerides": self._check_triglycerides(exam["tg_mg_dl"]),
-            "low_hdl": self._check_hdl(exam["hdl_mg_dl"], sex),
-        }
-        criteria_met = sum(risk_factors.values())
-        has_metabolic_syndrome = criteria_met >= 3
+    def invalidate(self, patient_id: Optional[int] = None):
+        """검진 데이터가 바뀐 환자(생략 시 전체)의 진단 메모를 비운다."""
+        if patient_id is None:
+            self._diagnoses.clear()
+        else:
+            self._diagnoses.pop(patient_id, None)
 
-        return {
-            "patient_id": patient_id,
-            "name": patient["name"],
-            "sex": sex,
-            "age": patient["age"],
-            "exam_at": exam["exam_at"],
-            "criteria_met": criteria_met,
-            "has_metabolic_syndrome": has_metabolic_syndrome,
-            "risk_factors": risk_factors,
-            "measurements": {
-                "waist_cm": exam["waist_cm"],
-                "systolic_mmHg": exam["systolic_mmHg"],
-                "diastolic_mmHg": exam["diastolic_mmHg"],
-                "fbg_mg_dl": exam["fbg_mg_dl"],
-                "tg_mg_dl": exam["tg_mg_dl"],
-                "hdl_mg_dl": exam["hdl_mg_dl"],
-                "bmi": exam["bmi"],
-            },
-        }
+    def get_all_diagnoses(self) -> List[Dict]:
+        """모든 환자의 최신 검진 기준 진단 결과를 한 번의 쿼리로 조회한다."""
+        rows = self._get_connection().execute(_SQL_ALL_DIAGNOSES).fetchall()
+        diagnoses = [self._build_diagnosis(row, row) for row in rows]
+        self._diagnoses.update((d["patient_id"], _copy_diagnosis(d)) for d in diagnoses)
+        return diagnoses
 
     def get_patients_with_metabolic_syndrome(self) -> List[Dict]:
-        results: List[Dict] = []
-        for patient in self.get_all_patients():
-            diagnosis = self.check_metabolic_syndrome(patient["patient_id"])
-            if diagnosis and diagnosis["has_metabolic_syndrome"]:
-                results.append(diagnosis)
-        return results
+        """기준 3개 이상을 충족한 환자만 한 번의 쿼리로 골라 진단 결과를 만든다."""
+        rows = self._get_connection().execute(
+            _SQL_METABOLIC_SYNDROME, _CRITERIA_PARAMS
+        ).fetchall()
+        return [self._build_diagnosis(row, row) for row in rows]
 
     def get_statistics(self) -> Dict:
-        all_patients = self.get_all_patients()
-        ms_patients = self.get_patients_with_metabolic_syndrome()
-        male = sum(1 for p in all_patients if p["sex"] == "남")
-        female = sum(1 for p in all_patients if p["sex"] == "여")
-
-        age_groups: Dict[str, int] = {}
-        for p in all_patients:
-            bucket = f"{p['age']//10*10}대"
-            age_groups[bucket] = age_groups.get(bucket, 0) + 1
+        # 집계는 모두 SQLite에서 수행하고 Python에서는 결과 행만 읽는다.
+        conn = self._get_connection()
+        total, male, female = conn.execute(_SQL_SEX_COUNTS).fetchone()
+        ms_count = conn.execute(
+            _SQL_METABOLIC_SYNDROME_COUNT, _CRITERIA_PARAMS
+        ).fetchone()[0]
+        age_groups = {
+            f"{decade}대": count
+            for decade, count in conn.execute(_SQL_AGE_DISTRIBUTION)
+        }
 
         return {
-            "total_patients": len(all_patients),
+            "total_patients": total,
             "male_patients": male,
             "female_patients": female,
-            "metabolic_syndrome_patients": len(ms_patients),
-            "metabolic_syndrome_rate": (
-                len(ms_patients) / len(all_patients) * 100 if all_patients else 0
-            ),
+            "metabolic_syndrome_patients": ms_count,
+            "metabolic_syndrome_rate": ms_count / total * 100 if total else 0,
             "age_distribution": age_groups,
         }
 
@@ -167,8 +391,11 @@ class PatientDatabase:
     # 위험도/보고서
     # ------------------------------------------------------------------ #
 
-    def evaluate_risk_level(self, patient_id: int) -> Optional[Dict]:
-        diagnosis = self.check_metabolic_syndrome(patient_id)
+    def evaluate_risk_level(
+        self, patient_id: int, diagnosis: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        if diagnosis is None:
+            diagnosis = self._memoized_diagnosis(patient_id)
         if not diagnosis:
             return None
 
@@ -199,27 +426,22 @@ class PatientDatabase:
             "risk_description": desc,
         }
 
-    def interpret_risk_factors(self, patient_id: int) -> Optional[Dict]:
-        diagnosis = self.check_metabolic_syndrome(patient_id)
+    def interpret_risk_factors(
+        self, patient_id: int, diagnosis: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        if diagnosis is None:
+            diagnosis = self._memoized_diagnosis(patient_id)
         if not diagnosis:
             return None
 
-        patient = self.get_patient(patient_id)
-        if not patient:
-            return None
-
-        sex = patient["sex"]
+        sex = diagnosis["sex"]
         measurements = diagnosis["measurements"]
         factors = diagnosis["risk_factors"]
 
         interpretations: Dict[str, Dict[str, str]] = {}
 
         waist = measurements["waist_cm"]
-        waist_threshold = (
-            self.CRITERIA["waist"]["male"]
-            if sex == "남"
-            else self.CRITERIA["waist"]["female"]
-        )
+        waist_threshold = _WAIST_MALE if sex == "남" else _WAIST_FEMALE
         interpretations["abdominal_obesity"] = (
             {
                 "status": "위험",
@@ -306,11 +528,7 @@ class PatientDatabase:
         )
 
         hdl = measurements["hdl_mg_dl"]
-        hdl_threshold = (
-            self.CRITERIA["hdl"]["male"]
-            if sex == "남"
-            else self.CRITERIA["hdl"]["female"]
-        )
+        hdl_threshold = _HDL_MALE if sex == "남" else _HDL_FEMALE
         interpretations["low_hdl"] = (
             {
                 "status": "위험",
@@ -332,21 +550,22 @@ class PatientDatabase:
         return interpretations
 
     def generate_diagnostic_report(self, patient_id: int) -> Optional[str]:
-        diagnosis = self.check_metabolic_syndrome(patient_id)
+        diagnosis = self._memoized_diagnosis(patient_id)
         if not diagnosis:
             return None
 
-        risk_eval = self.evaluate_risk_level(patient_id)
-        interpretations = self.interpret_risk_factors(patient_id) or {}
+        # 이미 계산한 진단 결과를 넘겨 같은 환자를 다시 조회하지 않는다.
+        risk_eval = self.evaluate_risk_level(patient_id, diagnosis)
+        interpretations = self.interpret_risk_factors(patient_id, diagnosis) or {}
 
         lines = [
             f"[환자 정보 - ID: {patient_id}]",
             f"이름: {diagnosis['name']} ({diagnosis['sex']}, {diagnosis['age']}세)",
-            f"검진일: {diagnosis['exam_at']}",
+            f"검진일: {diagnosis['exam_at'] or '정보 없음'}",
             "",
-            "=" * 60,
+            _REPORT_RULE,
             "대사증후군 진단 평가 결과",
-            "=" * 60,
+            _REPORT_RULE,
             "",
         ]
 
@@ -362,17 +581,9 @@ class PatientDatabase:
             lines.append(f"평가: {risk_eval['risk_description']}")
         lines.append("")
         lines.append("세부 평가:")
-        lines.append("-" * 60)
-
-        risk_labels = {
-            "abdominal_obesity": "1. 복부비만",
-            "high_blood_pressure": "2. 고혈압",
-            "high_fasting_glucose": "3. 공복혈당장애",
-            "high_triglycerides": "4. 고중성지방혈증",
-            "low_hdl": "5. 저HDL콜레스테롤혈증",
-        }
+        lines.append(_SECTION_RULE)
 
-        for key, label in risk_labels.items():
+        for key, label in _REPORT_RISK_LABELS:
             interp = interpretations.get(key)
             if not interp:
                 continue
@@ -388,47 +599,16 @@ class PatientDatabase:
                 ]
             )
 
-        lines.extend(
-            [
-                "",
-                "-" * 60,
-                "종합 권장사항:",
-                "-" * 60,
-            ]
-        )
+        lines.extend(("", _SECTION_RULE, "종합 권장사항:", _SECTION_RULE))
 
         if diagnosis["has_metabolic_syndrome"]:
-            lines.extend(
-                [
-                    "• 대사증후군으로 진단되어 의료진과의 정기적인 상담이 필요합니다.",
-                    "• 생활습관 개선: 규칙적인 운동(주 5회, 30분 이상), 균형잡힌 식단",
-                    "• 체중 감량: 현재 체중의 5-10% 감량 목표",
-                    "• 금연 및 절주",
-                    "• 스트레스 관리 및 충분한 수면",
-                ]
-            )
+            lines.extend(_MS_ADVICE)
+        elif diagnosis["criteria_met"] >= 2:
+            lines.extend(_PRE_MS_ADVICE)
+        elif diagnosis["criteria_met"] == 1:
+            lines.extend(_ONE_FACTOR_ADVICE)
         else:
-            if diagnosis["criteria_met"] >= 2:
-                lines.extend(
-                    [
-                        "• 대사증후군 전단계로 예방적 관리가 중요합니다.",
-                        "• 위험 요인 개선을 위한 생활습관 교정이 필요합니다.",
-                    ]
-                )
-            elif diagnosis["criteria_met"] == 1:
-                lines.extend(
-                    [
-                        "• 1개의 위험 요인이 있어 예방적 관리가 필요합니다.",
-                        "• 현재 상태가 악화되지 않도록 건강한 생활습관을 유지하세요.",
-                    ]
-                )
-            else:
-                lines.extend(
-                    [
-                        "• 현재 대사증후군 위험이 없으나 정기적인 검진을 권장합니다.",
-                        "• 건강한 생활습관을 꾸준히 유지하세요.",
-                    ]
-                )
+            lines.extend(_HEALTHY_ADVICE)
 
         return "\n".join(lines)
 
@@ -436,35 +616,40 @@ class PatientDatabase:
     # 내부 헬퍼
     # ------------------------------------------------------------------ #
 
-    def _check_abdominal_obesity(self, waist_cm: float, sex: str) -> bool:
-        if waist_cm is None:
-            return False
-        threshold = self.CRITERIA["waist"]["male"] if sex == "남" else self.CRITERIA["waist"]["female"]
-        return waist_cm >= threshold
-
-    def _check_blood_pressure(self, systolic_mmHg: int, diastolic_mmHg: int) -> bool:
-        if systolic_mmHg is None or diastolic_mmHg is None:
-            return False
-        return (
-            systolic_mmHg >= self.CRITERIA["blood_pressure"]["systolic"]
-            or diastolic_mmHg >= self.CRITERIA["blood_pressure"]["diastolic"]
-        )
+    def _get_patient_with_latest_exam(self, patient_id: int) -> Optional[Dict]:
+        """환자 정보와 최신 검진 값을 합친 한 행 (환자나 검진이 없으면 None)."""
+        row = self._get_connection().execute(
+            _SQL_PATIENT_LATEST_EXAM, (patient_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _build_diagnosis(self, patient, exam) -> Dict:
+        sex = patient["sex"]
+        flags = _evaluate_criteria(exam, sex)
+        risk_factors = dict(zip(_RISK_FACTOR_KEYS, flags))
+        criteria_met = sum(flags)
+        has_metabolic_syndrome = criteria_met >= 3
 
-    def _check_fasting_glucose(self, fbg_mg_dl: float) -> bool:
-        if fbg_mg_dl is None:
-            return False
-        return fbg_mg_dl >= self.CRITERIA["fasting_glucose"]
-
-    def _check_triglycerides(self, tg_mg_dl: float) -> bool:
-        if tg_mg_dl is None:
-            return False
-        return tg_mg_dl >= self.CRITERIA["triglycerides"]
-
-    def _check_hdl(self, hdl_mg_dl: float, sex: str) -> bool:
-        if hdl_mg_dl is None:
-            return False
-        threshold = self.CRITERIA["hdl"]["male"] if sex == "남" else self.CRITERIA["hdl"]["female"]
-        return hdl_mg_dl < threshold
+        return {
+            "patient_id": patient["patient_id"],
+            "name": patient["name"],
+            "sex": sex,
+            "age": patient["age"],
+            # 조회 시점에 한 번만 datetime으로 변환해 호출부의 재파싱을 없앤다.
+            "exam_at": _parse_timestamp(exam["exam_at"]) if exam["exam_at"] else None,
+            "criteria_met": criteria_met,
+            "has_metabolic_syndrome": has_metabolic_syndrome,
+            "risk_factors": risk_factors,
+            "measurements": {
+                "waist_cm": exam["waist_cm"],
+                "systolic_mmHg": exam["systolic_mmHg"],
+                "diastolic_mmHg": exam["diastolic_mmHg"],
+                "fbg_mg_dl": exam["fbg_mg_dl"],
+                "tg_mg_dl": exam["tg_mg_dl"],
+                "hdl_mg_dl": exam["hdl_mg_dl"],
+                "bmi": exam["bmi"],
+            },
+        }
 
 
 __all__ = ["PatientDatabase"]
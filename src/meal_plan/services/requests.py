@@ -2,10 +2,11 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+import re
+from dataclasses import dataclass, field, replace
 from datetime import date, datetime
 from enum import Enum
-from typing import List, Optional, Sequence
+from typing import Hashable, List, Optional, Sequence, Tuple
 
 
 class CounselorProfile(str, Enum):
@@ -20,17 +21,33 @@ class CounselorProfile(str, Enum):
 
 
 def _parse_date(value: str) -> date:
+    value = value.strip()
+    # 대부분의 입력은 ISO 형식이므로 C 구현 파서를 먼저 시도한다.
+    # fromisoformat은 20240501, 2024-W18-3 같은 형식도 받아들이므로 YYYY-MM-DD 모양일 때만 쓴다.
+    if len(value) == 10 and value[4] == value[7] == "-":
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
     try:
-        return datetime.strptime(value.strip(), "%Y-%m-%d").date()
+        # 0을 채우지 않은 입력(2024-5-1)은 기존처럼 strptime으로 처리한다.
+        return datetime.strptime(value, "%Y-%m-%d").date()
     except ValueError as exc:
         raise ValueError("날짜는 YYYY-MM-DD 형식으로 입력해주세요.") from exc
 
 
+# 입력 구분자 ';'를 ','로 통일하는 변환표
+_SEPARATOR_TABLE = str.maketrans(";", ",")
+
+# 칼로리 입력에서 숫자가 아닌 문자를 한 번에 제거한다.
+_NON_DIGITS = re.compile(r"\D+")
+
+
 def _parse_calories(value: str) -> Optional[int]:
     value = value.strip()
     if not value:
         return None
-    digits = "".join(ch for ch in value if ch.isdigit())
+    digits = _NON_DIGITS.sub("", value)
     if not digits:
         raise ValueError("칼로리 값에서 숫자를 추출할 수 없습니다.")
     calories = int(digits)
@@ -40,13 +57,9 @@ def _parse_calories(value: str) -> Optional[int]:
 
 
 def _parse_list(tokens: Sequence[str]) -> List[str]:
-    items: List[str] = []
-    for token in tokens:
-        for chunk in token.replace(";", ",").split(","):
-            name = chunk.strip()
-            if name:
-                items.append(name)
-    return items
+    # 토큰을 한 문자열로 합쳐 구분자 변환/분리를 한 번씩만 수행한다.
+    joined = ",".join(tokens).translate(_SEPARATOR_TABLE)
+    return [name for name in map(str.strip, joined.split(",")) if name]
 
 
 @dataclass(frozen=True)
@@ -66,12 +79,40 @@ class MealPlanRequest:
     def __post_init__(self):
         if self.start_date > self.end_date:
             raise ValueError("기간의 시작일은 종료일보다 앞서야 합니다.")
+        # 파생 값은 생성 시 한 번만 계산한다.
+        object.__setattr__(
+            self, "_duration_days", (self.end_date - self.start_date).days + 1
+        )
+        object.__setattr__(self, "_summary_lines", tuple(self._build_summary_lines()))
 
     @property
     def duration_days(self) -> int:
-        return (self.end_date - self.start_date).days + 1
+        return self._duration_days
+
+    def with_dates(self, start_date: date, end_date: date) -> "MealPlanRequest":
+        """기간만 바꾼 사본 (필드가 추가되거나 순서가 바뀌어도 나머지 값은 그대로 옮겨진다)."""
+        return replace(self, start_date=start_date, end_date=end_date)
+
+    def cache_key(self) -> Tuple[Hashable, ...]:
+        """프롬프트 내용이 같은 요청끼리 같은 값을 갖는 정규화 키.
+
+        환자 ID/상담사 구분은 프롬프트에 들어가지 않으므로 제외하고,
+        식품 목록 순서·대소문자와 공백 차이는 무시한다.
+        """
+        return (
+            self.start_date,
+            self.end_date,
+            self.target_calories,
+            tuple(sorted({food.casefold() for food in self.preferred_foods})),
+            tuple(sorted({food.casefold() for food in self.avoided_foods})),
+            self.snack_policy.strip(),
+            " ".join(self.special_notes.split()),
+        )
 
     def summary_lines(self) -> List[str]:
+        return list(self._summary_lines)
+
+    def _build_summary_lines(self) -> List[str]:
         cal_text = (
             f"{self.target_calories}kcal"
             if self.target_calories is not None
@@ -110,6 +151,8 @@ class RequestNormalizer:
     """상담사 입력을 구조화하는 파서."""
 
     MEAL_LABELS = ("아침", "점심", "저녁", "간식")
+    # 멤버십 검사용 (오류 메시지는 순서가 있는 MEAL_LABELS를 사용)
+    _MEAL_LABEL_SET = frozenset(MEAL_LABELS)
 
     def __init__(self, default_snack_policy: str = "포함"):
         self.default_snack_policy = default_snack_policy
@@ -159,11 +202,11 @@ class RequestNormalizer:
 
         normalized_meals: List[str] = []
         for token in meal_tokens:
-            for label in token.replace(";", ",").split(","):
+            for label in token.translate(_SEPARATOR_TABLE).split(","):
                 candidate = label.strip()
                 if not candidate:
                     continue
-                if candidate not in self.MEAL_LABELS:
+                if candidate not in self._MEAL_LABEL_SET:
                     raise ValueError(
                         f"지원하지 않는 식사 구분입니다: {candidate} "
                         f"(허용: {', '.join(self.MEAL_LABELS)})"
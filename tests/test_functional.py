@@ -1,125 +1,157 @@
+import importlib.util
+import re
 import sys
 import types
 import unittest
-from dataclasses import dataclass
-from datetime import date
+from datetime import date, timedelta
+from functools import lru_cache
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 SRC_PATH = PROJECT_ROOT / "src"
-if str(SRC_PATH) not in sys.path:
-    sys.path.insert(0, str(SRC_PATH))
+# 테스트는 조회만 하므로 읽기 전용으로 연다.
+DB_PATH = PROJECT_ROOT / "metabolic_health.sqlite"
+_SRC = str(SRC_PATH)
+if _SRC not in sys.path:
+    sys.path.insert(0, _SRC)
 
 
-def _ensure_stubbed_dependencies():
-    """테스트 환경에서 LangChain/LangGraph 패키지가 없을 때 최소 스텁을 제공한다."""
-    # --- langchain_core stubs ---
-    try:
-        import langchain_core  # type: ignore
-    except ModuleNotFoundError:  # pragma: no cover - only executed in bare envs
-        langchain_core = types.ModuleType("langchain_core")
-        sys.modules["langchain_core"] = langchain_core
+def _new_module(name: str) -> types.ModuleType:
+    module = types.ModuleType(name)
+    sys.modules[name] = module
+    return module
+
+
+# langchain_core.messages 스텁 본문. 모듈 네임스페이스에서 직접 실행해
+# 클래스의 __module__도 실제 패키지와 같게 맞춘다.
+_MESSAGES_STUB_SRC = """
+from dataclasses import dataclass
+
+
+class BaseMessage:
+    __slots__ = ("content",)
+
+    def __init__(self, content: str = ""):
+        self.content = content
+
+
+class SystemMessage(BaseMessage):
+    __slots__ = ()
+
+
+class HumanMessage(BaseMessage):
+    __slots__ = ()
+
+
+class AIMessage(BaseMessage):
+    __slots__ = ()
 
-        lm_module = types.ModuleType("langchain_core.language_models")
-        sys.modules["langchain_core.language_models"] = lm_module
 
-        chat_models = types.ModuleType("langchain_core.language_models.chat_models")
-        sys.modules["langchain_core.language_models.chat_models"] = chat_models
+# dataclass(slots=True)는 3.10 이상이므로 __slots__를 직접 선언한다.
+@dataclass(frozen=True)
+class ChatGeneration:
+    __slots__ = ("message",)
+    message: BaseMessage
 
-        class BaseChatModel:
-            model_name: str = "stub-model"
 
-            def invoke(self, messages):
-                result = self._generate(messages=messages)
-                return result.generations[-1].message
+@dataclass(frozen=True)
+class ChatResult:
+    __slots__ = ("generations",)
+    generations: list[ChatGeneration]
+"""
 
-            def _generate(self, *args, **kwargs):  # pragma: no cover - interface
-                raise NotImplementedError
 
-        chat_models.BaseChatModel = BaseChatModel
+@lru_cache(maxsize=None)
+def _messages_stub_code():
+    return compile(_MESSAGES_STUB_SRC, "<langchain_core.messages stub>", "exec")
 
-        messages_module = types.ModuleType("langchain_core.messages")
-        sys.modules["langchain_core.messages"] = messages_module
 
-        class BaseMessage:
-            def __init__(self, content: str = ""):
-                self.content = content
+def _stub_langchain_core():  # pragma: no cover - only executed in bare envs
+    _new_module("langchain_core")
+    _new_module("langchain_core.language_models")
+    chat_models = _new_module("langchain_core.language_models.chat_models")
 
-        class SystemMessage(BaseMessage):
-            pass
+    class BaseChatModel:
+        model_name: str = "stub-model"
 
-        class HumanMessage(BaseMessage):
-            pass
+        def invoke(self, messages):
+            result = self._generate(messages=messages)
+            return result.generations[-1].message
 
-        class AIMessage(BaseMessage):
-            pass
+        def _generate(self, *args, **kwargs):  # pragma: no cover - interface
+            raise NotImplementedError
 
-        @dataclass
-        class ChatGeneration:
-            message: BaseMessage
+    chat_models.BaseChatModel = BaseChatModel
 
-        @dataclass
-        class ChatResult:
-            generations: list[ChatGeneration]
+    messages_module = _new_module("langchain_core.messages")
+    exec(_messages_stub_code(), messages_module.__dict__)
 
-        messages_module.BaseMessage = BaseMessage
-        messages_module.SystemMessage = SystemMessage
-        messages_module.HumanMessage = HumanMessage
-        messages_module.AIMessage = AIMessage
-        messages_module.ChatGeneration = ChatGeneration
-        messages_module.ChatResult = ChatResult
+    # 실제 패키지와 같은 경로에서도 결과 타입을 불러올 수 있게 한다.
+    outputs = _new_module("langchain_core.outputs")
+    outputs.ChatGeneration = messages_module.ChatGeneration
+    outputs.ChatResult = messages_module.ChatResult
 
-    else:
-        # Ensure message classes exist; if import succeeded, no action needed
-        pass
 
-    # --- langgraph stubs ---
-    try:
-        import langgraph  # type: ignore
-    except ModuleNotFoundError:  # pragma: no cover
-        langgraph = types.ModuleType("langgraph")
-        sys.modules["langgraph"] = langgraph
+def _stub_langgraph():  # pragma: no cover - only executed in bare envs
+    _new_module("langgraph")
+    graph_module = _new_module("langgraph.graph")
 
-        graph_module = types.ModuleType("langgraph.graph")
-        sys.modules["langgraph.graph"] = graph_module
+    START = sys.intern("__start__")
+    END = sys.intern("__end__")
 
-        START = "__start__"
-        END = "__end__"
+    class StateGraph:
+        def __init__(self, _state_type):
+            self._nodes = []
 
-        class StateGraph:
-            def __init__(self, _state_type):
-                self._nodes = []
+        def add_node(self, name, func):
+            self._nodes.append(func)
 
-            def add_node(self, name, func):
-                self._nodes.append(func)
+        def add_edge(self, *_args, **_kwargs):
+            return self
 
-            def add_edge(self, *_args, **_kwargs):
-                return self
+        def compile(self):
+            class Compiled:
+                def __init__(self, nodes):
+                    self._nodes = nodes
 
-            def compile(self):
-                class Compiled:
-                    def __init__(self, nodes):
-                        self._nodes = nodes
+                def invoke(self, initial_state):
+                    state = dict(initial_state)
+                    for func in self._nodes:
+                        updates = func(state)
+                        if updates:
+                            state.update(updates)
+                    return state
 
-                    def invoke(self, initial_state):
-                        state = dict(initial_state)
-                        for func in self._nodes:
-                            updates = func(state)
-                            if updates:
-                                state.update(updates)
-                        return state
+            # 컴파일 시점의 노드 순서를 튜플로 고정한다.
+            return Compiled(tuple(self._nodes))
 
-                return Compiled(self._nodes)
+    graph_module.START = START
+    graph_module.END = END
+    graph_module.StateGraph = StateGraph
 
-        graph_module.START = START
-        graph_module.END = END
-        graph_module.StateGraph = StateGraph
+
+def _is_missing(name: str) -> bool:
+    # find_spec은 실제 패키지의 __init__을 실행하지 않고 설치 여부만 확인한다.
+    return name not in sys.modules and importlib.util.find_spec(name) is None
+
+
+def _ensure_stubbed_dependencies():
+    """테스트 환경에서 LangChain/LangGraph 패키지가 없을 때 최소 스텁을 제공한다."""
+    for package, build_stub in (
+        ("langchain_core", _stub_langchain_core),
+        ("langgraph", _stub_langgraph),
+    ):
+        if _is_missing(package):
+            build_stub()
 
 
 _ensure_stubbed_dependencies()
 
-from meal_plan.agents import MealPlanAgent
-from meal_plan.cli.counselor import OfflinePlanModel
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from meal_plan.agents import MealPlanAgent, MealPlanResult
 from meal_plan.context import PatientContextProvider
 from meal_plan.data import PatientDatabase
 from meal_plan.services import (
@@ -128,10 +160,56 @@ from meal_plan.services import (
     RequestNormalizer,
 )
 
+# 식단 표 머리글 행 (여러 검증에서 같은 컴파일 패턴을 재사용한다)
+_HEADER_RE = re.compile(r"^\| 날짜 \| 아침 \| 점심 \| 저녁 \| 간식 \|", re.MULTILINE)
+
+# 테스트 전반에서 쓰는 날짜 (date는 불변이므로 공유한다)
+_MAY_1 = date(2024, 5, 1)
+_MAY_2 = date(2024, 5, 2)
+_MAY_3 = date(2024, 5, 3)
+
+# 상태가 없는 파서이므로 모든 테스트가 하나를 공유한다.
+_NORMALIZER = RequestNormalizer()
+
+# 프롬프트의 요청 기간 줄 (- 기간: 2024-05-01 ~ 2024-05-03 (총 3일))
+_PERIOD_RE = re.compile(r"- 기간: (\d{4}-\d{2}-\d{2}) ~ (\d{4}-\d{2}-\d{2})")
+
+
+class OfflinePlanModel(BaseChatModel):
+    """요청 기간의 날짜마다 고정 메뉴 행을 채우는 결정적 오프라인 모델."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline-plan"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        period = _PERIOD_RE.search(messages[-1].content)
+        start, end = map(date.fromisoformat, period.groups())
+        lines = ["| 날짜 | 아침 | 점심 | 저녁 | 간식 |", "| --- | --- | --- | --- | --- |"]
+        for offset in range((end - start).days + 1):
+            day = start + timedelta(days=offset)
+            lines.append(f"| {day.isoformat()} | 현미밥 | 비빔밥 | 생선구이 | 사과 |")
+        lines.append("")
+        lines.append("- 총 칼로리: 1800kcal")
+        message = AIMessage(content="\n".join(lines))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@lru_cache(maxsize=None)
+def _shared_provider() -> PatientContextProvider:
+    """테스트 전체에서 DB 연결과 컨텍스트 제공자를 한 번만 만든다."""
+    return PatientContextProvider(PatientDatabase(DB_PATH, read_only=True))
+
+
+@lru_cache(maxsize=None)
+def _patient_context(patient_id: int, format: str = "standard"):
+    return _shared_provider().get_patient_context(patient_id, format=format)
+
 
 class RequestNormalizerTest(unittest.TestCase):
-    def setUp(self):
-        self.normalizer = RequestNormalizer()
+    @classmethod
+    def setUpClass(cls):
+        cls.normalizer = _NORMALIZER
 
     def test_plan_request_normalization(self):
         request = self.normalizer.normalize_plan_request(
@@ -143,60 +221,86 @@ class RequestNormalizerTest(unittest.TestCase):
             preferred_tokens=["생선, 채소"],
             avoided_tokens=["튀김"],
             snack_policy="포함",
-            hydration_focus=True,
             notes="운동 후 회복식 포함",
         )
 
         self.assertEqual(request.patient_id, 1)
-        self.assertEqual(request.start_date, date(2024, 5, 1))
-        self.assertEqual(request.end_date, date(2024, 5, 3))
+        self.assertEqual(request.start_date, _MAY_1)
+        self.assertEqual(request.end_date, _MAY_3)
         self.assertEqual(request.target_calories, 1800)
         self.assertEqual(request.preferred_foods, ["생선", "채소"])
         self.assertEqual(request.avoided_foods, ["튀김"])
-        self.assertTrue(request.hydration_focus)
         self.assertIn("운동 후 회복식", request.special_notes)
         self.assertEqual(request.duration_days, 3)
 
+    def test_cache_key_ignores_formatting(self):
+        common = dict(
+            start_date_str="2024-05-01",
+            end_date_str="2024-05-03",
+            calorie_text="1800kcal",
+            avoided_tokens=[""],
+            snack_policy="포함",
+        )
+        first = self.normalizer.normalize_plan_request(
+            counselor_profile=CounselorProfile.MEDICAL,
+            patient_id=1,
+            preferred_tokens=["생선, 채소"],
+            notes="운동 후  회복식",
+            **common,
+        )
+        second = self.normalizer.normalize_plan_request(
+            counselor_profile=CounselorProfile.EXERCISE,
+            patient_id=2,
+            preferred_tokens=["채소;생선"],
+            notes="운동 후 회복식",
+            **common,
+        )
+        self.assertEqual(first.cache_key(), second.cache_key())
+
     def test_revision_invalid_meal(self):
-        with self.assertRaises(ValueError):
-            self.normalizer.normalize_revision(
-                date_tokens=["2024-05-01"],
-                meal_tokens=["breakfast"],
-                change_notes="한식 위주로 변경",
-            )
+        self.assertRaises(
+            ValueError,
+            self.normalizer.normalize_revision,
+            date_tokens=["2024-05-01"],
+            meal_tokens=["breakfast"],
+            change_notes="한식 위주로 변경",
+        )
+
+    def test_revision_rejects_non_dashed_dates(self):
+        # fromisoformat만 받아들이는 형식은 여전히 거부되어야 한다.
+        for token in ("20240501", "2024-W18-3"):
+            with self.subTest(token=token):
+                self.assertRaises(
+                    ValueError,
+                    self.normalizer.normalize_revision,
+                    date_tokens=[token],
+                    meal_tokens=[],
+                    change_notes="한식 위주로 변경",
+                )
 
 
 class MealPlanAgentTest(unittest.TestCase):
-    def setUp(self):
-        self.agent = MealPlanAgent(OfflinePlanModel())
-        self.request = MealPlanRequest(
+    @classmethod
+    def setUpClass(cls):
+        # MealPlanRequest는 frozen이고 테스트에서 변경하지 않으므로 한 번만 만든다.
+        cls.request = MealPlanRequest(
             counselor_profile=CounselorProfile.MEDICAL,
             patient_id=1,
-            start_date=date(2024, 5, 1),
-            end_date=date(2024, 5, 2),
+            start_date=_MAY_1,
+            end_date=_MAY_2,
             target_calories=1800,
             preferred_foods=["생선", "채소"],
             avoided_foods=["튀김"],
             snack_policy="포함",
-            hydration_focus=True,
             special_notes="운동 후 회복식 포함",
         )
 
-    def test_generate_plan_offline(self):
-        db = PatientDatabase(PROJECT_ROOT / "metabolic_health.sqlite")
-        provider = PatientContextProvider(db)
-        context = provider.get_patient_context(1, format="standard")
-        self.assertIsNotNone(context)
-
-        result = self.agent.generate_plan(context or "", self.request)
-        self.assertIn("| 날짜 | 아침 | 점심 | 저녁 | 간식 |", result.markdown)
-        self.assertEqual(result.metadata["status"], "created")
-        self.assertEqual(result.start_date, date(2024, 5, 1))
-        self.assertEqual(result.end_date, date(2024, 5, 2))
+    def setUp(self):
+        self.agent = MealPlanAgent(OfflinePlanModel())
 
     def test_revision_flow(self):
         initial_plan = self.agent.generate_plan("환자 컨텍스트", self.request)
-        revision = RequestNormalizer().normalize_revision(
+        revision = _NORMALIZER.normalize_revision(
             date_tokens=["2024-05-02"],
             meal_tokens=["아침,저녁"],
             change_notes="탄수화물 비중을 낮춰 주세요.",
@@ -213,5 +317,105 @@ class MealPlanAgentTest(unittest.TestCase):
         self.assertIn("탄수화물", revised.metadata["change_notes"])
 
 
+class MealPlanResultTest(unittest.TestCase):
+    def test_continuity_digest_keeps_last_days(self):
+        result = MealPlanResult(
+            markdown="\n".join(
+                [
+                    "| 날짜 | 아침 | 점심 | 저녁 | 간식 |",
+                    "| --- | --- | --- | --- | --- |",
+                    "| 2024-05-01 | 잡곡밥 | 비빔밥 | 생선구이 | 사과 |",
+                    "| 2024-05-02 | 현미죽 | 쌈밥 | 두부조림 | 견과류 |",
+                    "| 2024-05-03 | 오트밀 | 콩국수 | 닭가슴살 | 요거트 |",
+                    "",
+                    "- 총 칼로리: 1800kcal",
+                ]
+            ),
+            start_date=_MAY_1,
+            end_date=_MAY_3,
+            patient_id=1,
+            mode="create",
+            metadata={},
+        )
+        digest = result.continuity_digest(days=2)
+        self.assertNotIn("2024-05-01", digest)
+        self.assertTrue(digest.startswith("| 2024-05-02"))
+        self.assertTrue(digest.endswith("요거트 |"))
+        self.assertEqual(result.continuity_digest(days=0), "")
+
+
+class FunctionalPipelineTest(unittest.TestCase):
+    """입력 정규화 → 환자 컨텍스트 → 오프라인 식단 생성을 한 번의 준비로 검증한다."""
+
+    # (patient_id, 시작일, 종료일, 칼로리, 선호, 기피, 간식 정책)
+    CASES = (
+        (1, "2024-05-01", "2024-05-02", "1800 kcal", ["생선, 채소"], ["튀김"], "포함"),
+        (2, "2024-05-01", "2024-05-03", "", ["채소"], [], "제외"),
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        cls.agent = MealPlanAgent(OfflinePlanModel())
+
+    def test_pipeline(self):
+        for case in self.CASES:
+            patient_id, start, end, calories, preferred, avoided, snack = case
+            with self.subTest(case=case):
+                request = _NORMALIZER.normalize_plan_request(
+                    counselor_profile=CounselorProfile.MEDICAL,
+                    patient_id=patient_id,
+                    start_date_str=start,
+                    end_date_str=end,
+                    calorie_text=calories,
+                    preferred_tokens=preferred,
+                    avoided_tokens=avoided,
+                    snack_policy=snack,
+                    notes="운동 후 회복식 포함",
+                )
+                context = _patient_context(patient_id, "standard")
+                self.assertIsNotNone(context)
+
+                result = self.agent.generate_plan(context or "", request)
+                self.assertRegex(result.markdown, _HEADER_RE)
+                self.assertEqual(result.metadata["status"], "created")
+                self.assertEqual(result.patient_id, patient_id)
+                self.assertEqual(result.start_date, request.start_date)
+                self.assertEqual(result.end_date, request.end_date)
+
+
+class PatientDatabaseTest(unittest.TestCase):
+    def test_bulk_diagnoses_match_single_lookup(self):
+        diagnoses = PatientDatabase(DB_PATH, read_only=True).get_all_diagnoses()
+        self.assertTrue(diagnoses)
+        # 메모가 비어 있는 새 인스턴스로 단건 조회 결과와 비교한다.
+        db = PatientDatabase(DB_PATH, read_only=True)
+        for diagnosis in diagnoses:
+            self.assertEqual(
+                diagnosis, db.check_metabolic_syndrome(diagnosis["patient_id"])
+            )
+
+    def test_syndrome_filter_matches_diagnoses(self):
+        db = PatientDatabase(DB_PATH, read_only=True)
+        expected = [d for d in db.get_all_diagnoses() if d["has_metabolic_syndrome"]]
+        self.assertEqual(db.get_patients_with_metabolic_syndrome(), expected)
+
+    def test_diagnosis_memo_and_invalidate(self):
+        db = PatientDatabase(DB_PATH, read_only=True)
+        first = db.check_metabolic_syndrome(1)
+        # 반환된 사본을 바꿔도 메모된 결과에는 남지 않아야 한다.
+        first["criteria_met"] = -1
+        first["risk_factors"]["low_hdl"] = None
+        second = db.check_metabolic_syndrome(1)
+        self.assertNotEqual(second, first)
+
+        memo = db._memoized_diagnosis(1)
+        self.assertIs(db._memoized_diagnosis(1), memo)
+        # 컨텍스트 캐시를 비우면 DB의 진단 메모도 함께 비워진다.
+        PatientContextProvider(db).invalidate(1)
+        refreshed = db._memoized_diagnosis(1)
+        self.assertIsNot(refreshed, memo)
+        self.assertEqual(refreshed, second)
+
+
 if __name__ == "__main__":
     unittest.main()